@@ -1,10 +1,21 @@
+import time
 from os import getenv
 
+# start of the startup budget, see app.utils.startup
+STARTED = time.perf_counter()
+
 from dotenv import load_dotenv
 
 load_dotenv()
 
 MONGO_DSN = getenv("MONGO_DSN")
+# pool sizes and LLM limits below are per worker, see app.server
+MONGO_MAX_POOL_SIZE = int(getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(getenv("MONGO_SOCKET_TIMEOUT_MS", 0)) or None
+MONGO_READ_PREFERENCE = getenv("MONGO_READ_PREFERENCE", "primary")
+MONGO_WRITE_CONCERN = getenv("MONGO_WRITE_CONCERN")
 ENVIRONMENT = getenv("ENVIRONMENT")
 ALGORITHM = getenv("ALGORITHM")
 SECRET_KEY = getenv("SECRET_KEY")
@@ -12,3 +23,54 @@ SECRET_KEY_USER = getenv("SECRET_KEY_USER")
 ACCESS_TOKEN_EXPIRE_MINUTES = getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
 GIGA_KEY = getenv("GIGA_KEY")
 
+GIGA_MAX_CONCURRENCY = int(getenv("GIGA_MAX_CONCURRENCY", 16))
+GIGA_TIMEOUT = float(getenv("GIGA_TIMEOUT", 60))
+LLM_DEADLINE = float(getenv("LLM_DEADLINE", 90))
+LLM_RETRIES = int(getenv("LLM_RETRIES", 2))
+LLM_RETRY_BACKOFF = float(getenv("LLM_RETRY_BACKOFF", 0.5))
+LLM_HEDGE = getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_MIN_SAMPLES = int(getenv("LLM_HEDGE_MIN_SAMPLES", 50))
+BREAKER_FAILURES = int(getenv("BREAKER_FAILURES", 5))
+BREAKER_RESET = float(getenv("BREAKER_RESET", 30))
+PRINCIPAL_CACHE_SIZE = int(getenv("PRINCIPAL_CACHE_SIZE", 10000))
+PRINCIPAL_CACHE_TTL = float(getenv("PRINCIPAL_CACHE_TTL", 30))
+PASSWORD_HASH_EXECUTOR = getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(getenv("PASSWORD_HASH_WORKERS", 4))
+PASSWORD_HASH_CONCURRENCY = int(getenv("PASSWORD_HASH_CONCURRENCY", 8))
+CONTEXT_TOKEN_BUDGET = int(getenv("CONTEXT_TOKEN_BUDGET", 2000))
+CONTEXT_MAX_MESSAGES = int(getenv("CONTEXT_MAX_MESSAGES", 20))
+SUMMARY_MAX_TOKENS = int(getenv("SUMMARY_MAX_TOKENS", 300))
+ADMIN_KEY = getenv("ADMIN_KEY")
+RESPONSE_CACHE_SIZE = int(getenv("RESPONSE_CACHE_SIZE", 5000))
+RESPONSE_CACHE_TTL = int(getenv("RESPONSE_CACHE_TTL", 86400))
+RESPONSE_CACHE_SIMILARITY = float(getenv("RESPONSE_CACHE_SIMILARITY", 0.9))
+RESPONSE_CACHE_MIN_LENGTH = int(getenv("RESPONSE_CACHE_MIN_LENGTH", 10))
+RESPONSE_CACHE_SCAN_LIMIT = int(getenv("RESPONSE_CACHE_SCAN_LIMIT", 256))
+RETRIEVAL_TOP_K = int(getenv("RETRIEVAL_TOP_K", 4))
+HOST = getenv("HOST", "0.0.0.0")
+PORT = int(getenv("PORT", 8000))
+WEB_CONCURRENCY = int(getenv("WEB_CONCURRENCY", 0))
+KEEP_ALIVE_TIMEOUT = int(getenv("KEEP_ALIVE_TIMEOUT", 75))
+DRAIN_TIMEOUT = float(getenv("DRAIN_TIMEOUT", 30))
+BACKPLANE = getenv("BACKPLANE", "memory")
+SESSION_TTL = float(getenv("SESSION_TTL", 60))
+RATE_LIMIT_STORE = getenv("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_USER_PER_MINUTE = float(getenv("RATE_LIMIT_USER_PER_MINUTE", 10))
+RATE_LIMIT_USER_BURST = int(getenv("RATE_LIMIT_USER_BURST", 5))
+RATE_LIMIT_ROLE_PER_MINUTE = float(getenv("RATE_LIMIT_ROLE_PER_MINUTE", 600))
+RATE_LIMIT_ROLE_BURST = int(getenv("RATE_LIMIT_ROLE_BURST", 100))
+LLM_MAX_WAITING = int(getenv("LLM_MAX_WAITING", 64))
+LLM_QUEUE_TIMEOUT = float(getenv("LLM_QUEUE_TIMEOUT", 10))
+WRITE_BEHIND_BUFFER = int(getenv("WRITE_BEHIND_BUFFER", 10000))
+WRITE_BEHIND_BATCH = int(getenv("WRITE_BEHIND_BATCH", 500))
+WRITE_BEHIND_INTERVAL = float(getenv("WRITE_BEHIND_INTERVAL", 0.2))
+LOG_LEVEL = getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATE = float(getenv("LOG_SAMPLE_RATE", 0.01))
+LOOP_LAG_INTERVAL = float(getenv("LOOP_LAG_INTERVAL", 0.5))
+ARCHIVE_KEEP_MESSAGES = int(getenv("ARCHIVE_KEEP_MESSAGES", 200))
+ARCHIVE_MIN_AGE = float(getenv("ARCHIVE_MIN_AGE", 30 * 86400))
+ARCHIVE_CHUNK = int(getenv("ARCHIVE_CHUNK", 100))
+ARCHIVE_INTERVAL = float(getenv("ARCHIVE_INTERVAL", 3600))
+STARTUP_BUDGET = float(getenv("STARTUP_BUDGET", 5))
+READY_TIMEOUT = float(getenv("READY_TIMEOUT", 2))
+READY_REQUIRES_LLM = getenv("READY_REQUIRES_LLM", "1") == "1"
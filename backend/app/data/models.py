@@ -1,15 +1,124 @@
-from beanie import Document, Link
+from beanie import Document, Link, PydanticObjectId
+from pymongo import IndexModel
 from pydantic import EmailStr, BaseModel, Field
 from uuid import UUID, uuid4
 from typing import List, Dict
+from datetime import datetime, timezone
 
+from app import RESPONSE_CACHE_TTL
 from app.data.schemas import Role, Gender
 
 
 class Conversation(Document):
+    """
+    Legacy single-document history. New turns are stored as ChatMessage documents,
+    old documents are moved there on startup by history.migrate_legacy_conversations.
+    """
+
     user_id: str
     messages: List[Dict] = []
 
+
+class ChatMessage(Document):
+    """
+    One message of a user's chat history.
+
+    Messages are only ever inserted, the ObjectId gives their order inside a history.
+
+    Attributes:
+        user_id (str): Id of the user the message belongs to.
+        role (str): "user" or "ai".
+        content (str): Message text.
+        created_at (datetime): When the message was stored.
+    """
+
+    user_id: str
+    role: str
+    content: str
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+    class Settings:
+        name = "messages"
+        indexes = [
+            IndexModel([("user_id", 1), ("_id", -1)]),
+        ]
+
+class ArchivedMessages(Document):
+    """
+    A run of old messages moved out of the `messages` collection by archive.Compactor.
+
+    Attributes:
+        user_id (str): Id of the user the messages belong to.
+        first_id (PydanticObjectId): Id of the oldest message in the run.
+        last_id (PydanticObjectId): Id of the newest message in the run.
+        size (int): Number of messages in the run.
+        data (bytes): Gzip-compressed JSON list of [id, role, content] triples, oldest first.
+        archived_at (datetime): When the run was archived.
+    """
+
+    user_id: str
+    first_id: PydanticObjectId
+    last_id: PydanticObjectId
+    size: int
+    data: bytes
+    archived_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+    class Settings:
+        name = "archive"
+        indexes = [
+            IndexModel([("user_id", 1), ("first_id", 1)], unique=True),
+            IndexModel([("user_id", 1), ("last_id", -1)]),
+        ]
+
+class ConversationSummary(Document):
+    """
+    Rolling summary of the part of a user's history that no longer fits the context window.
+
+    Attributes:
+        user_id (str): Id of the user the summary belongs to.
+        content (str): Summary text.
+        covered_until (PydanticObjectId): Id of the newest message folded into the summary.
+    """
+
+    user_id: str
+    content: str
+    covered_until: PydanticObjectId
+
+    class Settings:
+        name = "summaries"
+        indexes = [
+            IndexModel([("user_id", 1)], unique=True),
+        ]
+
+
+class CachedAnswer(Document):
+    """
+    Persistent tier of the assistant response cache.
+
+    Attributes:
+        role (str): Role the answer was generated for.
+        version (str): Version of the role prompt the answer was generated with.
+        audience (str): Age bucket and gender the system prompt was personalised for.
+        question (str): Normalised question text.
+        answer (str): Assistant reply.
+        created_at (datetime): When the answer was stored, documents expire RESPONSE_CACHE_TTL seconds later.
+    """
+
+    role: str
+    version: str
+    audience: str
+    question: str
+    answer: str
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+    class Settings:
+        name = "answers"
+        indexes = [
+            IndexModel([("role", 1), ("version", 1), ("audience", 1), ("question", 1)], unique=True),
+            IndexModel([("created_at", 1)], expireAfterSeconds=RESPONSE_CACHE_TTL),
+        ]
+
+
 class User(Document):
     id: UUID = Field(alias="_id", json_schema_extra={"unique": True}, default_factory=uuid4)
     first_name: str
@@ -21,6 +130,29 @@ class User(Document):
     gender: Gender
     history: List[Link[Conversation]] = []
 
+    class Settings:
+        indexes = [
+            IndexModel([("email", 1)], unique=True),
+        ]
+
+
+class UserPrincipal(BaseModel):
+    """
+    Projection of User loaded on every authenticated request.
+
+    Leaves out the password hash and the history links, so authentication cost does not
+    depend on the size of the user's chat history. Handlers that need the full document
+    load it themselves.
+    """
+
+    id: UUID = Field(alias="_id")
+    first_name: str
+    last_name: str
+    email: EmailStr
+    role: Role
+    age: int
+    gender: Gender
+
 
 class SecretAdmin(Document):
     """
@@ -74,7 +206,14 @@ class TokenData(BaseModel):
     username: str
 
 
-
-
-
-
+# every collection the application uses, handed to init_beanie at startup
+DOCUMENT_MODELS = [
+    User,
+    SecretAdmin,
+    AdminFront,
+    ChatMessage,
+    ArchivedMessages,
+    ConversationSummary,
+    CachedAnswer,
+    Conversation,
+]
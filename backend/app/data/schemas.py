@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Dict, List
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 
 
@@ -43,6 +43,11 @@ class Conversation(BaseModel):
     messages: List[Dict] = []
 
 
+class MessagePage(BaseModel):
+    messages: List[Dict] = []
+    next_cursor: Optional[str] = None
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -1,24 +1,173 @@
-from beanie import init_beanie, Document, UnionDoc
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, APIRouter
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from app import MONGO_DSN, ENVIRONMENT, projectConfig
+from app import (
+    MONGO_DSN, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS, MONGO_READ_PREFERENCE, MONGO_WRITE_CONCERN,
+    ENVIRONMENT, GIGA_KEY, GIGA_MAX_CONCURRENCY, GIGA_TIMEOUT, DRAIN_TIMEOUT, BACKPLANE, LLM_DEADLINE,
+    LLM_RETRIES, LLM_RETRY_BACKOFF, LLM_HEDGE, LLM_HEDGE_MIN_SAMPLES, BREAKER_FAILURES, BREAKER_RESET,
+    RATE_LIMIT_STORE, RATE_LIMIT_USER_PER_MINUTE, RATE_LIMIT_USER_BURST, RATE_LIMIT_ROLE_PER_MINUTE,
+    RATE_LIMIT_ROLE_BURST, LLM_MAX_WAITING, LLM_QUEUE_TIMEOUT, LOG_LEVEL, LOOP_LAG_INTERVAL,
+    ARCHIVE_KEEP_MESSAGES, ARCHIVE_MIN_AGE, ARCHIVE_CHUNK, ARCHIVE_INTERVAL, STARTUP_BUDGET, STARTED,
+    projectConfig
+)
+from app.data.models import DOCUMENT_MODELS
 from app.routers import system, user, ai
+from app.utils.database import Database
+from app.utils.drain import Drainer
+from app.utils.backplane import SessionHub, InMemoryBroker, MongoBroker
+from app.utils.admission import Admission, MemoryBuckets, MongoBuckets
+from app.utils.llm import LLMPool
+from app.utils.resilience import CircuitBreaker
+from app.utils.history import migrate_legacy_conversations, writer
+from app.utils.archive import Compactor
+from app.utils.security import password_hasher, principal_cache
+from app.utils.singleflight import singleflight
+from app.utils.context import summaries
+from app.utils.metrics import metrics, MetricsMiddleware, LoopLagMonitor
+from app.utils import logs
+from app.utils.prompt_registry import registry
+from app.utils.response_cache import response_cache
+from app.utils.indexes import verify_indexes
+from app.utils.startup import StartupReport
+
+logs.configure(LOG_LEVEL)
+startup = StartupReport(budget=STARTUP_BUDGET)
+startup.record("imports", time.perf_counter() - STARTED)
+
+
+async def maintenance():
+    """
+    Startup work that requests do not depend on, run once the worker is serving.
+    """
+    await verify_indexes(DOCUMENT_MODELS)
+    await response_cache.purge_stale(registry.versions())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    database = Database(
+        dsn=MONGO_DSN,
+        max_pool_size=MONGO_MAX_POOL_SIZE,
+        min_pool_size=MONGO_MIN_POOL_SIZE,
+        server_selection_timeout_ms=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        socket_timeout_ms=MONGO_SOCKET_TIMEOUT_MS,
+        read_preference=MONGO_READ_PREFERENCE,
+        write_concern=MONGO_WRITE_CONCERN
+    )
+    app.state.database = database
+    app.state.ready = False
+    app.state.startup = startup
+
+    with startup.phase("database"):
+        await database.init(DOCUMENT_MODELS)
+        await migrate_legacy_conversations()
+    with startup.phase("prompts"):
+        registry.load()
+
+    app.state.llm = LLMPool(
+        credentials=GIGA_KEY,
+        max_concurrency=GIGA_MAX_CONCURRENCY,
+        timeout=GIGA_TIMEOUT,
+        deadline=LLM_DEADLINE,
+        retries=LLM_RETRIES,
+        retry_backoff=LLM_RETRY_BACKOFF,
+        hedge=LLM_HEDGE,
+        hedge_min_samples=LLM_HEDGE_MIN_SAMPLES,
+        breaker=CircuitBreaker(failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET)
+    )
+    await app.state.llm.start()
+    if RATE_LIMIT_STORE == "mongo":
+        buckets = MongoBuckets(database.client.get_default_database())
+    else:
+        buckets = MemoryBuckets()
+    app.state.admission = Admission(
+        buckets,
+        user_per_minute=RATE_LIMIT_USER_PER_MINUTE,
+        user_burst=RATE_LIMIT_USER_BURST,
+        role_per_minute=RATE_LIMIT_ROLE_PER_MINUTE,
+        role_burst=RATE_LIMIT_ROLE_BURST,
+        max_concurrent=GIGA_MAX_CONCURRENCY,
+        max_waiting=LLM_MAX_WAITING,
+        wait_timeout=LLM_QUEUE_TIMEOUT
+    )
+    await app.state.admission.start()
+
+    app.state.drainer = Drainer(timeout=DRAIN_TIMEOUT)
+    app.state.drainer.install_signal_handler()
+
+    if BACKPLANE == "mongo":
+        broker = MongoBroker(database.client.get_default_database())
+    else:
+        broker = InMemoryBroker()
+    app.state.hub = SessionHub(broker)
+    app.state.hub.subscribe("prompts", system.on_prompts_reloaded)
+    await app.state.hub.start()
+    await writer.start()
+    app.state.compactor = Compactor(
+        app.state.hub.broker,
+        keep=ARCHIVE_KEEP_MESSAGES,
+        min_age=ARCHIVE_MIN_AGE,
+        chunk_size=ARCHIVE_CHUNK,
+        interval=ARCHIVE_INTERVAL
+    )
+    await app.state.compactor.start()
+
+    app.state.loop_lag = LoopLagMonitor(LOOP_LAG_INTERVAL)
+    await app.state.loop_lag.start()
+    metrics.gauges("mongo_pool", database.pool_stats)
+    metrics.gauges("llm", app.state.llm.stats)
+    metrics.gauges("principal_cache", principal_cache.stats)
+    metrics.gauges("summary_cache", summaries.stats)
+    metrics.gauges("response_cache", response_cache.stats)
+    metrics.gauges("password_hasher", password_hasher.stats)
+    metrics.gauges("admission", app.state.admission.stats)
+    metrics.gauges("singleflight", singleflight.stats)
+    metrics.gauges("write_behind", writer.stats)
+    metrics.gauges("archive", app.state.compactor.stats)
+    metrics.gauges("sessions", app.state.hub.stats)
+
+    startup.record("services", time.perf_counter() - STARTED - sum(startup.phases.values()))
+    startup.log()
+    maintenance_task = asyncio.create_task(maintenance())
+    app.state.ready = True
+
+    yield
+
+    app.state.ready = False
+    maintenance_task.cancel()
+
+    await app.state.loop_lag.close()
+    await app.state.compactor.close()
+    await app.state.hub.close()
+    await app.state.llm.close()
+    await writer.close()
+    password_hasher.shutdown()
+    database.close()
+
 
 if ENVIRONMENT == "prod":
     app = FastAPI(
         title=projectConfig.__projname__,
         version=projectConfig.__version__,
         description=projectConfig.__description__,
-        docs_url=None
+        docs_url=None,
+        lifespan=lifespan,
+        default_response_class=ORJSONResponse
     )
 
 else:
     app = FastAPI(
         title=projectConfig.__projname__,
         version=projectConfig.__version__,
-        description=projectConfig.__description__
+        description=projectConfig.__description__,
+        lifespan=lifespan,
+        default_response_class=ORJSONResponse
     )
     
 api_router = APIRouter(prefix="/api")
@@ -29,6 +178,8 @@ api_router.include_router(ai.router)
 
 app.include_router(api_router)
 
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -36,12 +187,3 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-@app.on_event('startup')
-async def startup_event():
-    client = AsyncIOMotorClient(MONGO_DSN)
-
-    await init_beanie(
-        database=client.get_default_database(),
-        document_models=Document.__subclasses__() + UnionDoc.__subclasses__()
-    )
\ No newline at end of file
@@ -1,120 +1,226 @@
-from gigachat import GigaChat
 from gigachat.models import Chat, Messages, MessagesRole
-from fastapi import APIRouter, WebSocket, Depends
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query
+from fastapi.responses import StreamingResponse
 from app.utils.security import get_current_user
 from app.utils.security import get_current_user_websocket
-from app import GIGA_KEY
-from app.utils import prompts
-from app.data.models import User, Conversation
+from app.utils import protocol, history, context, prompt_registry
+from app.utils.response_cache import response_cache, normalise
+from app.utils.singleflight import singleflight
+from app.utils.session import AssistantSession
+from app.utils.admission import Overloaded
+from app.utils.resilience import CircuitOpen, LLMUnavailable
+from app.utils.metrics import ws_connections, ws_messages, ws_message_seconds
+from app.utils.logs import sampled
+from app.data.models import UserPrincipal
 from app.data import schemas
 from app.utils.error import Error
+from app import GIGA_TIMEOUT, LOG_SAMPLE_RATE
 from typing import List, Dict
-from beanie import Link
+from beanie import Link, PydanticObjectId
+from bson.errors import InvalidId
+import functools
+import hashlib
 import uuid
-import json
+import orjson
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/ai", tags=["AI"])
 
-ca_bundle_file = r"app/russian_trusted_root_ca_pem.crt"
+LLM_TIMEOUT_REPLY = "Извините, я сейчас не успеваю ответить. Попробуйте, пожалуйста, ещё раз чуть позже."
+BUSY_REPLY = "Сейчас мне пишут очень много, подождите, пожалуйста, немного и спросите ещё раз."
+UNAVAILABLE_REPLY = "Извините, у меня временные технические трудности. Попробуйте, пожалуйста, ещё раз через минуту."
 
 async def save_conversation(user_id: str, new_messages: List[Dict]):
-    conversation = await Conversation.find_one(Conversation.user_id == user_id)
-    if conversation:
-
-        conversation.messages.extend(new_messages)
-        await conversation.save()
-    else:
-        conversation = Conversation(
-            user_id=user_id,
-            messages=new_messages
-        )
-        await conversation.insert()
-    user = await User.find_one(User.id == uuid.UUID(user_id), fetch_links=True)
-    if not user or not user.history:
-        user.history.append(conversation)
-        await user.save()
+    await history.append_messages(user_id, new_messages)
             
-async def payloads(payload: str, age: int, gender: str):
-    if payload == "student":
-        return Chat(
-            messages=[
-                Messages(
-                    role=MessagesRole.SYSTEM,
-                    content=prompts.prompts["student"]+f"Учитывай возраст:{age} и пол: {gender}"
-                )
-            ],
-            temperature=0.8,
-            max_tokens=10000,
-        )
-    if payload == "retraining":
-        return Chat(
-            messages=[
-                Messages(
-                    role=MessagesRole.SYSTEM,
-                    content=prompts.prompts["retraining"]+f"Учитывай возраст:{age} и пол: {gender}"
-                )
-            ],
-            temperature=0.4,
-            max_tokens=10000,
-        )
-    if payload == "teacher":
-        return Chat(
-            messages=[
-                Messages(
-                    role=MessagesRole.SYSTEM,
-                    content=prompts.prompts["teacher"]+f"Учитывай возраст:{age} и пол: {gender}"
-                )
-            ],
-            temperature=0.6,
-            max_tokens=10000,
+async def reply(llm, emit, payload: Chat) -> str | None:
+    message_id = uuid.uuid4().hex
+    await emit(protocol.start(message_id))
+    try:
+        response = await llm.chat(payload)
+    except CircuitOpen:
+        await emit(protocol.error(message_id, UNAVAILABLE_REPLY))
+        return None
+    except LLMUnavailable:
+        await emit(protocol.error(message_id, LLM_TIMEOUT_REPLY))
+        return None
+    except Exception:
+        # errors that are not upstream's fault (a rejected payload, bad credentials) are not
+        # retried, but the client still gets its reply closed
+        logger.exception("GigaChat call failed")
+        await emit(protocol.error(message_id, UNAVAILABLE_REPLY))
+        return None
+    content = response.choices[0].message.content
+    await emit(protocol.done(message_id, content))
+    return content
+
+async def reply_streaming(llm, emit, payload: Chat) -> str | None:
+    message_id = uuid.uuid4().hex
+    await emit(protocol.start(message_id))
+    parts = []
+    try:
+        async for part in llm.stream(payload):
+            parts.append(part)
+            await emit(protocol.delta(message_id, part))
+    except CircuitOpen:
+        await emit(protocol.error(message_id, UNAVAILABLE_REPLY))
+        return None
+    except LLMUnavailable:
+        await emit(protocol.error(message_id, LLM_TIMEOUT_REPLY))
+        return None
+    except Exception:
+        # errors that are not upstream's fault (a rejected payload, bad credentials) are not
+        # retried, but the client still gets its reply closed
+        logger.exception("GigaChat call failed")
+        await emit(protocol.error(message_id, UNAVAILABLE_REPLY))
+        return None
+    content = "".join(parts)
+    await emit(protocol.done(message_id, content))
+    return content
+
+async def send_reply(emit, content: str):
+    message_id = uuid.uuid4().hex
+    await emit(protocol.start(message_id))
+    await emit(protocol.delta(message_id, content))
+    await emit(protocol.done(message_id, content))
+
+async def generate(llm, admission, emit, payload: Chat, streaming: bool) -> str | None:
+    try:
+        async with admission.slot():
+            if streaming:
+                return await reply_streaming(llm, emit, payload)
+            return await reply(llm, emit, payload)
+    except Overloaded as error:
+        await emit(protocol.busy(BUSY_REPLY, error.retry_after))
+        return None
+
+async def answer(llm, admission, emit, session: AssistantSession, data: str, streaming: bool) -> str | None:
+    role = session.role
+    version = prompt_registry.registry.get(role).version
+    audience = prompt_registry.audience(session.age, session.gender)
+    notes, messages = await context.assemble(session.user_id, llm)
+    # without earlier questions or a summary the answer depends only on the role, the
+    # audience the prompt is personalised for and the question, so it can be shared:
+    # served from the response cache, or, for identical questions asked at the same
+    # moment, produced by one upstream call
+    standalone = not notes and not any(message.role == MessagesRole.USER for message in messages)
+    if standalone:
+        content = await response_cache.lookup(role, version, audience, data)
+        if content is not None:
+            await send_reply(emit, content)
+            return content
+
+    # while upstream is known to be down, answer at once instead of queueing for it
+    if not llm.breaker.available():
+        await emit(protocol.busy(UNAVAILABLE_REPLY, llm.breaker.retry_after()))
+        return None
+    # rate limits are per user, so they are applied before a question joins a shared call
+    try:
+        await admission.check_rate(session.user_id, role)
+    except Overloaded as error:
+        await emit(protocol.busy(BUSY_REPLY, error.retry_after))
+        return None
+
+    messages.append(Messages(role=MessagesRole.USER, content=data))
+    payload = prompt_registry.registry.chat(role, session.age, session.gender, messages, data, notes)
+    if logger.isEnabledFor(logging.DEBUG) and sampled(LOG_SAMPLE_RATE):
+        logger.debug("chat payload", extra={"fields": {
+            "user_id": session.user_id,
+            "role": role,
+            "version": version,
+            "messages": len(payload.messages),
+            "prompt_tokens": sum(context.estimate_tokens(message.content) for message in payload.messages),
+            "standalone": standalone,
+        }})
+    if standalone:
+        content, leader = await singleflight.run(
+            (role, version, audience, normalise(data)),
+            emit,
+            lambda flight_emit: generate(llm, admission, flight_emit, payload, streaming)
         )
-    if payload == "management":
-        return Chat(
-            messages=[
-                Messages(
-                    role=MessagesRole.SYSTEM,
-                    content=prompts.prompts["management"]+f"Учитывай возраст:{age} и пол: {gender}"
-                )
-            ],
-            temperature=0.2,
-            max_tokens=10000,
-        ) 
-    
+    else:
+        content, leader = await generate(llm, admission, emit, payload, streaming), True
+    if content is not None and leader and standalone:
+        await response_cache.store(role, version, audience, data, content)
+    return content
+
+async def receive_question(websocket: WebSocket, codec: protocol.Codec | None) -> str:
+    if codec is None or codec.decode is None:
+        return await websocket.receive_text()
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        try:
+            frame = codec.decode(message.get("bytes") or message.get("text"))
+        except (ValueError, TypeError):
+            continue
+        if isinstance(frame, dict) and frame.get("type") == "question" and isinstance(frame.get("content"), str):
+            return frame["content"]
+
+def claim_key(user_id: str, data: str) -> str:
+    return f"{user_id}:{hashlib.sha1(data.strip().lower().encode()).hexdigest()}"
+
 @router.websocket("/")
 async def assistant(websocket: WebSocket) -> str:
-    await websocket.accept()
+    drainer = websocket.app.state.drainer
+    hub = websocket.app.state.hub
+    llm = websocket.app.state.llm
+    admission = websocket.app.state.admission
+    codec = protocol.negotiate(websocket.scope.get("subprotocols", []))
+    await websocket.accept(subprotocol=codec.subprotocol if codec else None)
+    if drainer.draining:
+        await drainer.close(websocket)
+        return
+    if codec is None and websocket.query_params.get("stream") == "1":
+        codec = protocol.STREAM_JSON
+    streaming = codec is not None
     current_user = await get_current_user_websocket(websocket.query_params.get("Authorization"))
-    while True:
-        user = await User.find_one(User.id == current_user.id)
-        if not user:
-            raise Error.USER_NOT_FOUND
-        if not user.history:
-            ai_message = [{
-                    "role": "ai",
-                    "content": "Привет! Я твой виртуальный помощник Метроша. Чем могу помочь?"
-                }]
-            await save_conversation(str(user.id), ai_message)
-        data = await websocket.receive_text()
-        user_message = {
-                "role": "user",
-                "content": data
-            }
-        payload = await payloads(str(user.role.value), user.age, str(user.gender.value))
-        print(payload)
-        with GigaChat(credentials=GIGA_KEY, ca_bundle_file=ca_bundle_file, verify_ssl_certs=False) as giga:
-            payload.messages.append(Messages(role=MessagesRole.USER, content=data))
-            response = giga.chat(payload)
-            payload.messages.append(response.choices[0].message)
-            ai_message = {
-                "role": "ai",
-                "content": response.choices[0].message.content
-            }
-        await websocket.send_text(response.choices[0].message.content)
-
-        session_messages = []
-        session_messages.append(user_message)
-        session_messages.append(ai_message)
-        await save_conversation(str(user.id), session_messages)
+    user_id = str(current_user.id)
+    emit = functools.partial(hub.publish, user_id)
+    ws_connections.inc()
+    with drainer.session(websocket), hub.connect(user_id, websocket, codec):
+        session = AssistantSession.from_principal(current_user, hub.version(user_id))
+        try:
+            if not await history.has_messages(user_id):
+                ai_message = [{
+                        "role": "ai",
+                        "content": "Привет! Я твой виртуальный помощник Метроша. Чем могу помочь?"
+                    }]
+                await save_conversation(user_id, ai_message)
+            while True:
+                data = await receive_question(websocket, codec)
+                ws_messages.inc()
+                version = hub.version(user_id)
+                if session.stale(version) and not await session.refresh(version):
+                    raise Error.USER_NOT_FOUND
+                user_message = {
+                        "role": "user",
+                        "content": data
+                    }
+                # the same question sent from another tab of this user is already being answered,
+                # its reply reaches this socket through the hub
+                key = claim_key(user_id, data)
+                if not await hub.broker.claim(key, GIGA_TIMEOUT * 2):
+                    continue
+                try:
+                    with drainer.busy(websocket), ws_message_seconds.time():
+                        content = await answer(llm, admission, emit, session, data, streaming)
+                        if content is not None:
+                            ai_message = {
+                                "role": "ai",
+                                "content": content
+                            }
+                            await save_conversation(user_id, [user_message, ai_message])
+                finally:
+                    await hub.broker.release(key)
+                if drainer.draining:
+                    await drainer.close(websocket)
+                    return
+        except WebSocketDisconnect:
+            pass
         
 @router.delete(
     '/',
@@ -125,12 +231,10 @@ async def assistant(websocket: WebSocket) -> str:
         }
     }
 )
-async def remove_history(get_current_user: User = Depends(get_current_user)):
-    history = await Conversation.find_one(Conversation.user_id == str(get_current_user.id))
-    if not history:
+async def remove_history(get_current_user: UserPrincipal = Depends(get_current_user)):
+    if not await history.clear_messages(str(get_current_user.id)):
         raise Error.HISTORY_NOT_FOUND
-    history.messages = [history.messages[0]]
-    await history.save()
+    await context.forget(str(get_current_user.id))
         
 @router.get(
     '/',
@@ -141,13 +245,59 @@ async def remove_history(get_current_user: User = Depends(get_current_user)):
         }
     }
 )
-async def get_conversation(get_current_user: User = Depends(get_current_user)) -> schemas.Conversation:
-    history = await Conversation.find_one(Conversation.user_id == str(get_current_user.id))
-    if not history:
+async def get_conversation(get_current_user: UserPrincipal = Depends(get_current_user)) -> schemas.Conversation:
+    user_id = str(get_current_user.id)
+    messages = await history.get_messages(user_id)
+    if not messages:
         raise Error.HISTORY_NOT_FOUND
     
     return schemas.Conversation(
-        user_id=history.user_id,
-        messages=history.messages
+        user_id=user_id,
+        messages=messages
     )
-        
+
+def parse_cursor(before: str | None) -> PydanticObjectId | None:
+    if before is None:
+        return None
+    try:
+        return PydanticObjectId(before)
+    except InvalidId:
+        raise Error.INVALID_CURSOR
+
+@router.get(
+    '/messages',
+    description="get history page, newest first",
+    responses={
+        401: {
+            "description": "Unauthorised. You are not authorised to get history"
+        }
+    }
+)
+async def get_messages_page(
+    limit: int = Query(default=50, ge=1, le=500),
+    before: str | None = None,
+    get_current_user: UserPrincipal = Depends(get_current_user)
+) -> schemas.MessagePage:
+    messages, next_cursor = await history.get_page(str(get_current_user.id), limit, parse_cursor(before))
+    return schemas.MessagePage(
+        messages=messages,
+        next_cursor=next_cursor
+    )
+
+@router.get(
+    '/messages/stream',
+    description="stream history as NDJSON, newest first",
+    responses={
+        401: {
+            "description": "Unauthorised. You are not authorised to get history"
+        }
+    }
+)
+async def stream_messages(before: str | None = None, get_current_user: UserPrincipal = Depends(get_current_user)):
+    cursor = parse_cursor(before)
+
+    async def lines():
+        async for message in history.iter_messages(str(get_current_user.id), cursor):
+            yield orjson.dumps(message) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
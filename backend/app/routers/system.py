@@ -1,7 +1,79 @@
-from fastapi import APIRouter
+import logging
+
+from fastapi import APIRouter, Header, Request
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+
+from app import ADMIN_KEY, READY_TIMEOUT, READY_REQUIRES_LLM
+from app.data.models import DOCUMENT_MODELS
+from app.utils.error import Error
+from app.utils.prompt_registry import registry
+from app.utils.response_cache import response_cache
+from app.utils.indexes import index_report
+from app.utils.metrics import metrics
 
 router = APIRouter(prefix="/system")
 
+logger = logging.getLogger(__name__)
+
+def check_admin_key(key: str | None):
+    if not ADMIN_KEY or key != ADMIN_KEY:
+        raise Error.UNAUTHORIZED_INVALID
+
 @router.get('/ping')
 async def ping() -> str:
-    return 'pong'
\ No newline at end of file
+    return 'pong'
+
+@router.get('/live')
+async def live() -> dict:
+    return {"status": "alive"}
+
+@router.get('/ready')
+async def ready(request: Request):
+    state = request.app.state
+    started = getattr(state, "ready", False)
+    checks = {
+        "started": started,
+        "draining": started and state.drainer.draining,
+        "mongo": started and await state.database.ping(READY_TIMEOUT),
+        "llm_warm": started and state.llm.warm,
+    }
+    is_ready = checks["started"] and not checks["draining"] and checks["mongo"] \
+        and (checks["llm_warm"] or not READY_REQUIRES_LLM)
+    body = {"ready": is_ready, "checks": checks}
+    if started:
+        body["mongo_pool"] = state.database.pool_stats()
+        body["startup"] = state.startup.report()
+    return ORJSONResponse(body, status_code=200 if is_ready else 503)
+
+@router.get('/metrics', response_class=PlainTextResponse)
+async def get_metrics() -> str:
+    return metrics.render()
+
+@router.get('/llm')
+async def get_llm_state(request: Request) -> dict:
+    llm = request.app.state.llm
+    return {"breaker": llm.breaker.stats(), **llm.stats()}
+
+@router.post('/prompts/reload')
+async def reload_prompts(request: Request, x_admin_key: str | None = Header(default=None)) -> dict:
+    check_admin_key(x_admin_key)
+    versions = registry.reload()
+    # the other workers reload too, so that none of them keeps serving, or purging
+    # the stored answers of, a version this one no longer uses
+    await request.app.state.hub.broadcast("prompts", {"versions": versions})
+    await response_cache.purge_stale(versions)
+    return versions
+
+async def on_prompts_reloaded(message: dict):
+    """
+    Applies a prompt reload done by another worker.
+    """
+    versions = registry.reload()
+    response_cache.discard_stale(versions)
+    if versions != message["versions"]:
+        logger.warning("prompts here differ from the worker that reloaded them: %s != %s", versions, message["versions"])
+
+@router.get('/indexes')
+async def get_index_report(x_admin_key: str | None = Header(default=None)) -> dict:
+    check_admin_key(x_admin_key)
+    return await index_report(DOCUMENT_MODELS)
@@ -1,15 +1,16 @@
 from http.client import HTTPException
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 from fastapi.security import OAuth2PasswordRequestForm
 
 from datetime import timedelta
 
-from app.data.models import User
+from app.data.models import User, UserPrincipal
 from app.data import schemas
 from app.utils.error import Error
 from app.utils.auth import create_user, authenticate_user
-from app.utils.security import verify_password, get_current_user
+from app.utils.security import verify_password, get_current_user, invalidate_principal
+from app.utils import history, context
 
 from typing import Annotated
 import uuid
@@ -31,7 +32,7 @@ async def registration_user(request: schemas.UserSchema) -> schemas.UserLogIn:
 @router.post("/login")
 async def log_in_user(request: Annotated[OAuth2PasswordRequestForm, Depends()]) -> schemas.Token:
     user = await User.find_one(User.email == request.username)
-    if not user or not verify_password(request.password, user.password):
+    if not user or not await verify_password(request.password, user.password):
         raise Error.UNAUTHORIZED_INVALID
 
     token_expires = timedelta(minutes=1440)
@@ -49,17 +50,22 @@ async def log_in_user(request: Annotated[OAuth2PasswordRequestForm, Depends()])
         }
     }
 )
-async def change_user(request: schemas.UserUpdate, get_current_user: User = Depends(get_current_user)): 
-    userdata = await User.find_one(User.email == get_current_user.email)
-    if not userdata:
+async def change_user(http_request: Request, request: schemas.UserUpdate, get_current_user: UserPrincipal = Depends(get_current_user)): 
+    result = await User.find_one(User.id == get_current_user.id).update({"$set": {
+        "role": request.new_role.value,
+        "age": request.new_age,
+        "gender": request.new_gender.value
+    }})
+    if not result.matched_count:
         raise Error.USER_NOT_FOUND
+    invalidate_principal(get_current_user.email)
+    await http_request.app.state.hub.invalidate(str(get_current_user.id))
 
-    userdata.role = request.new_role
-    userdata.age = request.new_age
-    userdata.gender = request.new_gender
-
-    await userdata.save()
-    return userdata
+    return get_current_user.model_copy(update={
+        "role": request.new_role,
+        "age": request.new_age,
+        "gender": request.new_gender
+    })
 
 
 @router.delete(
@@ -71,12 +77,15 @@ async def change_user(request: schemas.UserUpdate, get_current_user: User = Depe
         }
     }
 )
-async def annigilation_of_user(get_current_user: User = Depends(get_current_user)):
-    userdel = await User.find_one(User.email == get_current_user.email)
-    if not userdel:
+async def annigilation_of_user(http_request: Request, get_current_user: UserPrincipal = Depends(get_current_user)):
+    result = await User.find_one(User.id == get_current_user.id).delete()
+    if not result or not result.deleted_count:
         raise Error.USER_NOT_FOUND
+    invalidate_principal(get_current_user.email)
+    await http_request.app.state.hub.invalidate(str(get_current_user.id))
+    await history.delete_messages(str(get_current_user.id))
+    await context.forget(str(get_current_user.id))
 
-    await userdel.delete()
     return "Succesfully deleted user"
 
 
@@ -89,16 +98,5 @@ async def annigilation_of_user(get_current_user: User = Depends(get_current_user
         }
     }
 )
-async def get_user(get_current_user: User = Depends(get_current_user)):
-    userdata = await User.find_one(User.email == get_current_user.email)
-    if not userdata:
-        raise Error.USER_NOT_FOUND
-    return userdata
-
-
-
-
-
-
-
-
+async def get_user(get_current_user: UserPrincipal = Depends(get_current_user)):
+    return get_current_user
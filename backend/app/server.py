@@ -0,0 +1,83 @@
+"""
+Production entry point: python -m app.server
+
+Runs WEB_CONCURRENCY uvicorn workers on uvloop and httptools without the
+reload file watcher. By default there is one worker per CPU the container may
+use (its cgroup quota, not the host's CPU count), at most MAX_DEFAULT_WORKERS.
+
+Every worker has its own Mongo pool (MONGO_MAX_POOL_SIZE connections) and its
+own GigaChat limits (GIGA_MAX_CONCURRENCY, LLM_MAX_WAITING), so the totals for
+the service are these values times the number of workers. For local development use the
+docker-compose profile, which runs uvicorn with --reload.
+"""
+
+import logging
+import math
+import os
+
+import uvicorn
+
+from app import HOST, PORT, WEB_CONCURRENCY, KEEP_ALIVE_TIMEOUT, DRAIN_TIMEOUT, BACKPLANE, SESSION_TTL
+
+MAX_DEFAULT_WORKERS = 4
+
+logger = logging.getLogger(__name__)
+
+
+def cgroup_cpus() -> float | None:
+    """
+    The CPU quota of the container, None when it is not limited.
+    """
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as file:
+            quota, period = file.read().split()
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as file:
+            quota = int(file.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as file:
+            period = int(file.read())
+        return quota / period if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def default_workers() -> int:
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    quota = cgroup_cpus()
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, min(cpus, MAX_DEFAULT_WORKERS))
+
+
+def main():
+    workers = WEB_CONCURRENCY or default_workers()
+    if workers > 1 and BACKPLANE == "memory":
+        logger.warning(
+            "%d workers with BACKPLANE=memory: replies and profile changes do not reach sockets "
+            "on other workers, sessions there pick up profile changes only after SESSION_TTL=%ss; "
+            "set BACKPLANE=mongo",
+            workers, SESSION_TTL
+        )
+    uvicorn.run(
+        "app.main:app",
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        ws="websockets",
+        timeout_keep_alive=KEEP_ALIVE_TIMEOUT,
+        timeout_graceful_shutdown=DRAIN_TIMEOUT,
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+        reload=False
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Admission control in front of the LLM call.
+
+Every question that needs the model takes a token from the user's bucket and
+from the bucket of the user's role (check_rate), then its upstream call waits
+for one of `max_concurrent` slots (slot). The two are separate so that
+questions coalesced into one call are each charged to their own user, while
+only the shared call takes a slot. At most `max_waiting` calls wait for a slot,
+and none waits longer than `wait_timeout`; anything beyond that is refused with
+Overloaded so the socket can answer "busy" right away instead of queueing.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+
+from app.utils.cache import TTLCache
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class MemoryBuckets:
+    def __init__(self):
+        self.buckets = TTLCache(maxsize=100000, ttl=3600)
+
+    async def take(self, key: str, capacity: float, rate: float) -> float:
+        """
+        Takes one token. Returns 0 on success, otherwise seconds until a token is available.
+        """
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens < 1:
+            self.buckets.set(key, (tokens, now))
+            return (1 - tokens) / rate
+        self.buckets.set(key, (tokens - 1, now))
+        return 0
+
+
+class MongoBuckets:
+    """
+    Buckets shared by all workers, updated atomically with a pipeline update.
+    """
+
+    def __init__(self, database):
+        self.collection = database["rate_limits"]
+
+    async def start(self):
+        await self.collection.create_index("updated", expireAfterSeconds=3600)
+
+    async def take(self, key: str, capacity: float, rate: float) -> float:
+        now = datetime.now(timezone.utc)
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated", now]}]}, 1000]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {
+                    "tokens": {"$min": [capacity, {"$add": [{"$ifNull": ["$tokens", capacity]}, {"$multiply": [elapsed, rate]}]}]},
+                    "updated": now
+                }},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket["allowed"]:
+            return 0
+        return (1 - bucket["tokens"]) / rate
+
+
+class Admission:
+    def __init__(
+        self,
+        buckets,
+        user_per_minute: float,
+        user_burst: int,
+        role_per_minute: float,
+        role_burst: int,
+        max_concurrent: int,
+        max_waiting: int,
+        wait_timeout: float
+    ):
+        self.buckets = buckets
+        self.user_rate = user_per_minute / 60
+        self.user_burst = user_burst
+        self.role_rate = role_per_minute / 60
+        self.role_burst = role_burst
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.waiting = 0
+        self.admitted = 0
+        self.rate_limited = 0
+        self.rejected = 0
+
+    async def start(self):
+        if hasattr(self.buckets, "start"):
+            await self.buckets.start()
+
+    async def check_rate(self, user_id: str, role: str):
+        retry_after = await self.buckets.take(f"user:{user_id}", self.user_burst, self.user_rate)
+        if not retry_after:
+            retry_after = await self.buckets.take(f"role:{role}", self.role_burst, self.role_rate)
+        if retry_after:
+            self.rate_limited += 1
+            raise Overloaded("rate_limited", retry_after)
+
+    @asynccontextmanager
+    async def slot(self):
+        if not self.semaphore.locked():
+            # a free slot is taken without suspending, wait_for would count it as waiting
+            await self.semaphore.acquire()
+        elif self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise Overloaded("busy", self.wait_timeout)
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), self.wait_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise Overloaded("busy", self.wait_timeout)
+            finally:
+                self.waiting -= 1
+
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from beanie import PydanticObjectId
+from pymongo.errors import DuplicateKeyError
+
+from app.data.models import ArchivedMessages, ChatMessage
+from app.utils.backplane import Broker
+from app.utils.history import MessageView, pack
+
+logger = logging.getLogger(__name__)
+
+COMPACTION_CLAIM = "archive:compaction"
+
+
+class Compactor:
+    """
+    Background job that keeps the `messages` collection small.
+
+    Every `interval` seconds, for each user with more than `keep` messages, it moves
+    messages older than `min_age` seconds (and not among the newest `keep`) into the
+    `archive` collection as gzip-compressed runs of `chunk_size` messages. Only full
+    runs are written, so the runs of a history never change once archived; a run
+    that was stored but whose messages were not yet deleted (or that another worker
+    stored first) is recognised by its unique (user_id, first_id) key.
+
+    Each pass is claimed on the broker for one `interval`, so only one worker of
+    the deployment compacts at a time, and it only groups the messages older than
+    `min_age`, which the `_id` index narrows down before the `$group`.
+    """
+
+    def __init__(self, broker: Broker, keep: int, min_age: float, chunk_size: int, interval: float):
+        self.broker = broker
+        self.keep = max(1, keep)
+        self.min_age = min_age
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self.runs = 0
+        self.skipped = 0
+        self.archived = 0
+        self.failures = 0
+        self._task = None
+
+    async def start(self):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.compact_all()
+            except Exception:
+                self.failures += 1
+                logger.exception("history compaction failed")
+
+    async def compact_all(self) -> int:
+        if not await self.broker.claim(COMPACTION_CLAIM, self.interval):
+            self.skipped += 1
+            return 0
+        self.runs += 1
+        moved = 0
+        pipeline = [
+            {"$match": {"_id": {"$lt": self._cutoff()}}},
+            {"$group": {"_id": "$user_id", "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gte": self.chunk_size}}},
+        ]
+        async for row in ChatMessage.get_motor_collection().aggregate(pipeline):
+            moved += await self.compact(row["_id"])
+        if moved:
+            logger.info("archived %s chat messages", moved)
+        return moved
+
+    async def compact(self, user_id: str) -> int:
+        newest_kept = await ChatMessage.find(ChatMessage.user_id == user_id) \
+            .sort(-ChatMessage.id).skip(self.keep - 1).limit(1).project(MessageView).first_or_none()
+        if newest_kept is None:
+            return 0
+        until = min(newest_kept.id, self._cutoff())
+
+        moved = 0
+        while True:
+            chunk = await ChatMessage.find(ChatMessage.user_id == user_id, ChatMessage.id < until) \
+                .sort(+ChatMessage.id).limit(self.chunk_size).project(MessageView).to_list()
+            if len(chunk) < self.chunk_size:
+                break
+            run = ArchivedMessages(
+                user_id=user_id,
+                first_id=chunk[0].id,
+                last_id=chunk[-1].id,
+                size=len(chunk),
+                data=pack(chunk)
+            )
+            try:
+                await run.insert()
+            except DuplicateKeyError:
+                pass
+            await ChatMessage.find(ChatMessage.user_id == user_id, ChatMessage.id <= chunk[-1].id).delete()
+            moved += len(chunk)
+        self.archived += moved
+        return moved
+
+    def _cutoff(self) -> PydanticObjectId:
+        return PydanticObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=self.min_age))
+
+    def stats(self) -> dict:
+        return {"runs": self.runs, "skipped": self.skipped, "archived": self.archived, "failures": self.failures}
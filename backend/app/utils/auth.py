@@ -1,22 +1,19 @@
-from app.utils.security import context_pass
+from app.utils.security import hash_password
 from app.data.models import User
 from app.data import schemas
 from datetime import datetime, timedelta, timezone
-from passlib.context import CryptContext
 from app import ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, SECRET_KEY
 from app.utils.error import Error
-from app.routers.ai import save_conversation
+from app.utils import history
 
 import jwt
 
-context_pass = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 
 async def create_user(request: schemas.UserSchema):
     user_exists = await User.find_one(User.email == request.email)
     if user_exists:
         raise Error.LOGIN_EXISTS
-    hashed_password = context_pass.hash(request.password)[:72]
+    hashed_password = (await hash_password(request.password))[:72]
     user = User(
         first_name=request.first_name,
         last_name=request.last_name,
@@ -32,7 +29,7 @@ async def create_user(request: schemas.UserSchema):
             "content": "Привет! Я твой виртуальный помощник Метроша. Чем могу помочь?"
         }]
     await user.create()
-    await save_conversation(str(user.id), ai_message)
+    await history.append_messages(str(user.id), ai_message)
     return user
     
 async def authenticate_user(data: dict, expires_delta):
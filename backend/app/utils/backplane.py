@@ -0,0 +1,322 @@
+"""
+Delivery of assistant frames to every open socket of a user, across workers.
+
+Each worker runs one SessionHub that knows its own sockets. Frames are sent to
+the local sockets directly and published on the broker, where the hubs of other
+workers pick them up. Brokers also provide short-lived claims, used so that only
+one socket (tab) generates an answer to a given question at a time.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+
+from app.utils.protocol import Codec
+
+CHANGE_STREAM_HISTORY_LOST = 286
+
+logger = logging.getLogger(__name__)
+
+
+class Broker(ABC):
+    # whether per-token delta frames are worth sending to other workers
+    forwards_deltas = True
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def publish(self, channel: str, message: dict):
+        ...
+
+    @abstractmethod
+    def listen(self) -> AsyncIterator[Tuple[str, dict]]:
+        ...
+
+    @abstractmethod
+    async def claim(self, key: str, ttl: float) -> bool:
+        ...
+
+    @abstractmethod
+    async def release(self, key: str):
+        ...
+
+
+class InMemoryBroker(Broker):
+    """
+    Broker for a single process. Several hubs may listen to one instance, which is
+    how tests stand in for several workers.
+    """
+
+    def __init__(self):
+        self.listeners: List[asyncio.Queue] = []
+        self.claims: Dict[str, float] = {}
+
+    async def publish(self, channel: str, message: dict):
+        for queue in self.listeners:
+            queue.put_nowait((channel, message))
+
+    def listen(self) -> AsyncIterator[Tuple[str, dict]]:
+        # registered right away, so nothing published after listen() is missed
+        queue = asyncio.Queue()
+        self.listeners.append(queue)
+        return self._drain(queue)
+
+    async def _drain(self, queue: asyncio.Queue) -> AsyncIterator[Tuple[str, dict]]:
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.listeners.remove(queue)
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        now = time.monotonic()
+        if self.claims.get(key, 0) > now:
+            return False
+        self.claims[key] = now + ttl
+        return True
+
+    async def release(self, key: str):
+        self.claims.pop(key, None)
+
+
+class MongoBroker(Broker):
+    """
+    Broker over MongoDB for multi-worker and multi-node deployments.
+
+    Messages are inserted into a small TTL-expired collection and read back through
+    a change stream, so it needs a replica set (a single-node one is enough). Delta
+    frames are not forwarded: remote sockets get the start and the full done frame.
+
+    Every broker records a heartbeat in the nodes collection and counts the other
+    live ones. While it has no peers nothing is published and claims are kept in
+    memory, so a single worker costs no Mongo writes per question; a peer that
+    just started is noticed within `heartbeat` seconds.
+    """
+
+    forwards_deltas = False
+
+    def __init__(self, database, message_ttl: int = 60, heartbeat: float = 5):
+        self.events = database["events"]
+        self.claims = database["claims"]
+        self.nodes = database["nodes"]
+        self.message_ttl = message_ttl
+        self.heartbeat = heartbeat
+        self.node = uuid.uuid4().hex
+        self.peers = 0
+        self.local = InMemoryBroker()
+        self._task = None
+
+    async def start(self):
+        await self.events.create_index("created_at", expireAfterSeconds=self.message_ttl)
+        await self.claims.create_index("expires_at", expireAfterSeconds=0)
+        await self.nodes.create_index("seen_at", expireAfterSeconds=int(self.heartbeat * 10))
+        await self._beat()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.nodes.delete_one({"_id": self.node})
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            try:
+                await self._beat()
+            except PyMongoError:
+                # keep the last known peer count until Mongo answers again
+                pass
+
+    async def _beat(self):
+        now = datetime.now(timezone.utc)
+        await self.nodes.update_one({"_id": self.node}, {"$set": {"seen_at": now}}, upsert=True)
+        self.peers = await self.nodes.count_documents({
+            "_id": {"$ne": self.node},
+            "seen_at": {"$gt": now - timedelta(seconds=self.heartbeat * 3)}
+        })
+
+    async def publish(self, channel: str, message: dict):
+        if not self.peers:
+            return
+        await self.events.insert_one({
+            "channel": channel,
+            "message": message,
+            "created_at": datetime.now(timezone.utc)
+        })
+
+    async def listen(self) -> AsyncIterator[Tuple[str, dict]]:
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        resume_token = None
+        while True:
+            try:
+                async with self.events.watch(pipeline, resume_after=resume_token) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        document = change["fullDocument"]
+                        yield document["channel"], document["message"]
+            except OperationFailure as error:
+                if error.code == CHANGE_STREAM_HISTORY_LOST:
+                    # the oplog no longer reaches back to the token, start from now
+                    resume_token = None
+                await asyncio.sleep(1)
+            except PyMongoError:
+                await asyncio.sleep(1)
+
+    async def claim(self, key: str, ttl: float) -> bool:
+        # a tab of the same user on this worker is rejected without a round trip
+        if not await self.local.claim(key, ttl):
+            return False
+        if not self.peers:
+            return True
+        now = datetime.now(timezone.utc)
+        try:
+            # matches only an expired claim, otherwise inserts one unless it exists
+            await self.claims.update_one(
+                {"_id": key, "expires_at": {"$lt": now}},
+                {"$set": {"expires_at": now + timedelta(seconds=ttl)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            await self.local.release(key)
+            return False
+        return True
+
+    async def release(self, key: str):
+        await self.local.release(key)
+        if self.peers:
+            await self.claims.delete_one({"_id": key})
+
+
+class SessionHub:
+    def __init__(self, broker: Broker):
+        self.broker = broker
+        self.node = uuid.uuid4().hex
+        self.sockets: Dict[str, Dict[WebSocket, Optional[Codec]]] = {}
+        self.versions: Dict[str, int] = {}
+        self.handlers: Dict[str, Callable[[dict], Awaitable[None]]] = {}
+        self.restart_delay = 1.0
+        self._task = None
+
+    async def start(self):
+        await self.broker.start()
+        self._task = asyncio.create_task(self._listen(self.broker.listen()))
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+        await self.broker.close()
+
+    @contextmanager
+    def connect(self, user_id: str, websocket: WebSocket, codec: Optional[Codec]):
+        self.sockets.setdefault(user_id, {})[websocket] = codec
+        try:
+            yield
+        finally:
+            self._discard(user_id, websocket)
+
+    async def publish(self, user_id: str, frame: dict):
+        await self.deliver(user_id, frame)
+        if frame["type"] != "delta" or self.broker.forwards_deltas:
+            await self.broker.publish(f"user:{user_id}", {"node": self.node, "frame": frame})
+
+    def stats(self) -> dict:
+        return {"users": len(self.sockets), "sockets": sum(len(sockets) for sockets in self.sockets.values())}
+
+    def version(self, user_id: str) -> int:
+        return self.versions.get(user_id, 0)
+
+    async def invalidate(self, user_id: str):
+        """
+        Marks the user's open assistant sessions on every worker as stale.
+        """
+        self._bump(user_id)
+        await self.broker.publish(f"session:{user_id}", {"node": self.node})
+
+    def subscribe(self, kind: str, handler: Callable[[dict], Awaitable[None]]):
+        """
+        Calls `handler` with every message other workers broadcast under `kind`.
+        """
+        self.handlers[kind] = handler
+
+    async def broadcast(self, kind: str, message: dict):
+        await self.broker.publish(f"{kind}:", {**message, "node": self.node})
+
+    def _bump(self, user_id: str):
+        if user_id in self.sockets:
+            self.versions[user_id] = self.version(user_id) + 1
+
+    async def deliver(self, user_id: str, frame: dict):
+        """
+        Sends a frame to this worker's sockets of the user, encoded once per codec.
+        Sockets without a codec only get the final text, as a plain message.
+        """
+        encoded = {}
+        for websocket, codec in list(self.sockets.get(user_id, {}).items()):
+            try:
+                if codec is not None:
+                    if codec not in encoded:
+                        encoded[codec] = codec.encode(frame)
+                    if codec.binary:
+                        await websocket.send_bytes(encoded[codec])
+                    else:
+                        await websocket.send_text(encoded[codec])
+                elif frame["type"] == "done":
+                    await websocket.send_text(frame["content"])
+                elif frame["type"] in ("error", "busy"):
+                    await websocket.send_text(frame["detail"])
+            except Exception as error:
+                # the socket went away; it gets nothing more and the others still get the frame
+                if not isinstance(error, (WebSocketDisconnect, RuntimeError, ConnectionError)):
+                    logger.exception("sending a frame to a socket of user %s failed", user_id)
+                self._discard(user_id, websocket)
+
+    def _discard(self, user_id: str, websocket: WebSocket):
+        sockets = self.sockets.get(user_id, {})
+        sockets.pop(websocket, None)
+        if not sockets:
+            self.sockets.pop(user_id, None)
+            self.versions.pop(user_id, None)
+
+    async def _listen(self, messages: AsyncIterator[Tuple[str, dict]]):
+        """
+        Handles messages from other workers for as long as the hub runs. A message that
+        cannot be handled is logged and skipped; if the broker's stream itself fails,
+        listening starts over on a new one.
+        """
+        while True:
+            try:
+                async for channel, message in messages:
+                    try:
+                        await self._handle(channel, message)
+                    except Exception:
+                        logger.exception("handling a message on %s failed", channel)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("listening to the broker failed, restarting")
+                await asyncio.sleep(self.restart_delay)
+            messages = self.broker.listen()
+
+    async def _handle(self, channel: str, message: dict):
+        if message["node"] == self.node:
+            return
+        kind, user_id = channel.split(":", 1)
+        if kind == "user":
+            await self.deliver(user_id, message["frame"])
+        elif kind == "session":
+            self._bump(user_id)
+        elif kind in self.handlers:
+            await self.handlers[kind](message)
@@ -0,0 +1,124 @@
+"""
+Assembly of the conversation context sent to the model with every question.
+
+The newest turns are taken from storage while they fit CONTEXT_TOKEN_BUDGET
+(measured with a local estimate, no tokenizer round-trip). Everything older
+is represented by a rolling summary that is refreshed in the background, so
+the prompt stays bounded however long the chat runs.
+"""
+
+import asyncio
+import logging
+import math
+import re
+from typing import List, Optional, Tuple
+
+from gigachat.models import Chat, Messages, MessagesRole
+
+from app import CONTEXT_TOKEN_BUDGET, CONTEXT_MAX_MESSAGES, SUMMARY_MAX_TOKENS
+from app.data.models import ConversationSummary
+from app.utils import history
+from app.utils.cache import TTLCache
+
+SUMMARY_PROMPT = (
+    "Кратко перескажи разговор пользователя с виртуальным помощником. "
+    "Сохрани факты о пользователе, его вопросы и данные ему ответы. "
+    "Пиши без вступлений, не длиннее нескольких предложений."
+)
+
+logger = logging.getLogger(__name__)
+
+_pieces = re.compile(r"\w+|[^\w\s]")
+
+summaries = TTLCache(maxsize=10000, ttl=600)
+_refreshing = {}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count: one token per punctuation mark and per ~4 characters of a word,
+    which is close to what GigaChat reports for Russian text.
+    """
+    return sum(math.ceil(len(piece) / 4) for piece in _pieces.findall(text))
+
+
+def to_llm_message(message) -> Messages:
+    role = MessagesRole.USER if message.role == "user" else MessagesRole.ASSISTANT
+    return Messages(role=role, content=message.content)
+
+
+async def get_summary(user_id: str) -> Optional[ConversationSummary]:
+    summary = summaries.get(user_id)
+    if summary is None:
+        summary = await ConversationSummary.find_one(ConversationSummary.user_id == user_id)
+        summaries.set(user_id, summary or False)
+    return summary or None
+
+
+async def forget(user_id: str):
+    summaries.pop(user_id)
+    await ConversationSummary.find(ConversationSummary.user_id == user_id).delete()
+
+
+async def assemble(user_id: str, llm) -> Tuple[List[str], List[Messages]]:
+    """
+    Returns notes for the system prompt (the summary) and the messages to put between
+    the system prompt and the new question.
+    """
+    # one message more than the window can hold tells whether older ones exist
+    recent = await history.get_recent(user_id, CONTEXT_MAX_MESSAGES + 1)
+    summary = await get_summary(user_id)
+    budget = CONTEXT_TOKEN_BUDGET - (estimate_tokens(summary.content) if summary else 0)
+
+    window = []
+    for message in recent[:CONTEXT_MAX_MESSAGES]:
+        if summary and message.id <= summary.covered_until:
+            break
+        budget -= estimate_tokens(message.content)
+        if budget < 0:
+            break
+        window.append(message)
+
+    # everything older than the window and not yet summarised is summarised up to
+    # the message just before the window, whether the budget or the message cap cut it
+    dropped = recent[len(window):]
+    if dropped and (not summary or dropped[0].id > summary.covered_until):
+        refresh_summary(user_id, dropped[0].id, summary, llm)
+
+    notes = [f"Краткое содержание предыдущего разговора: {summary.content}"] if summary else []
+    return notes, [to_llm_message(message) for message in reversed(window)]
+
+
+def refresh_summary(user_id: str, until, summary: Optional[ConversationSummary], llm):
+    if user_id in _refreshing:
+        return
+    _refreshing[user_id] = asyncio.create_task(_refresh_summary(user_id, until, summary, llm))
+
+
+async def _refresh_summary(user_id: str, until, summary: Optional[ConversationSummary], llm):
+    try:
+        after = summary.covered_until if summary else None
+        messages = await history.get_between(user_id, after, until, CONTEXT_MAX_MESSAGES * 5)
+        if not messages:
+            return
+        dialog = "\n".join(f"{message.role}: {message.content}" for message in messages)
+        if summary:
+            dialog = f"Предыдущее краткое содержание: {summary.content}\n{dialog}"
+        response = await llm.chat(Chat(
+            messages=[
+                Messages(role=MessagesRole.SYSTEM, content=SUMMARY_PROMPT),
+                Messages(role=MessagesRole.USER, content=dialog)
+            ],
+            temperature=0.2,
+            max_tokens=SUMMARY_MAX_TOKENS,
+        ))
+        updated = summary or ConversationSummary(user_id=user_id, content="", covered_until=until)
+        updated.content = response.choices[0].message.content
+        updated.covered_until = messages[-1].id
+        await updated.save()
+        summaries.set(user_id, updated)
+    except Exception:
+        # the previous summary stays in use, the next question retries
+        logger.exception("summary refresh failed for user %s", user_id)
+    finally:
+        _refreshing.pop(user_id, None)
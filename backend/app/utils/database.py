@@ -0,0 +1,137 @@
+import asyncio
+
+from beanie import init_beanie
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+from app.utils.indexes import reconcile_ttl_indexes
+from app.utils.metrics import mongo_command_seconds, mongo_command_failures
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Counts connection pool events so the pool can be sized against real usage.
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkouts_started = 0
+        self.checkouts_failed = 0
+        self.checkouts = 0
+        self.peak_checked_out = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.closed += 1
+
+    def connection_check_out_started(self, event):
+        self.checkouts_started += 1
+
+    def connection_check_out_failed(self, event):
+        self.checkouts_failed += 1
+
+    def connection_checked_out(self, event):
+        self.checkouts += 1
+        self.checked_out += 1
+        self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Times every command the driver sends, labelled by command name.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_command_seconds.observe(event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        mongo_command_seconds.observe(event.duration_micros / 1e6, command=event.command_name)
+        mongo_command_failures.inc(command=event.command_name)
+
+
+class Database:
+    """
+    The process-wide Motor client, opened and closed by the application lifespan.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        max_pool_size: int,
+        min_pool_size: int,
+        server_selection_timeout_ms: int,
+        socket_timeout_ms: int | None,
+        read_preference: str,
+        write_concern: str | None
+    ):
+        self.max_pool_size = max_pool_size
+        self.pool_metrics = PoolMetrics()
+        options = {}
+        if write_concern:
+            options["w"] = int(write_concern) if write_concern.isdigit() else write_concern
+        self.client = AsyncIOMotorClient(
+            dsn,
+            maxPoolSize=max_pool_size,
+            minPoolSize=min_pool_size,
+            serverSelectionTimeoutMS=server_selection_timeout_ms,
+            socketTimeoutMS=socket_timeout_ms,
+            readPreference=read_preference,
+            event_listeners=[self.pool_metrics, CommandMetrics()],
+            **options
+        )
+
+    async def init(self, document_models):
+        database = self.client.get_default_database()
+        await reconcile_ttl_indexes(database, document_models)
+        await init_beanie(
+            database=database,
+            document_models=document_models
+        )
+
+    async def ping(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self.client.admin.command("ping"), timeout)
+        except Exception:
+            return False
+        return True
+
+    def close(self):
+        self.client.close()
+
+    def pool_stats(self) -> dict:
+        metrics = self.pool_metrics
+        return {
+            "max_pool_size": self.max_pool_size,
+            "open": metrics.created - metrics.closed,
+            "checked_out": metrics.checked_out,
+            "peak_checked_out": metrics.peak_checked_out,
+            "saturation": metrics.checked_out / self.max_pool_size,
+            "waiting": metrics.checkouts_started - metrics.checkouts - metrics.checkouts_failed,
+            "checkouts": metrics.checkouts,
+            "checkouts_failed": metrics.checkouts_failed,
+        }
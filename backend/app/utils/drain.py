@@ -0,0 +1,88 @@
+import asyncio
+import signal
+from contextlib import contextmanager
+from typing import Dict
+
+from fastapi import WebSocket
+
+SERVICE_RESTART = 1012
+
+
+class Drainer:
+    """
+    Lets a worker finish in-flight assistant replies before it exits.
+
+    On SIGTERM the worker stops taking new assistant sockets, closes idle ones with
+    code 1012 (service restart) so clients reconnect to another worker, waits up to
+    `timeout` seconds for sockets that are generating a reply and only then hands
+    the signal to uvicorn's own shutdown.
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.draining = False
+        self.sessions: Dict[WebSocket, bool] = {}
+        self._task = None
+
+    @contextmanager
+    def session(self, websocket: WebSocket):
+        self.sessions[websocket] = False
+        try:
+            yield
+        finally:
+            self.sessions.pop(websocket, None)
+
+    @contextmanager
+    def busy(self, websocket: WebSocket):
+        self.sessions[websocket] = True
+        try:
+            yield
+        finally:
+            self.sessions[websocket] = False
+
+    async def close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=SERVICE_RESTART)
+        except RuntimeError:
+            # already closed
+            pass
+
+    async def drain(self):
+        self.draining = True
+        for websocket, busy in list(self.sessions.items()):
+            if not busy:
+                await self.close(websocket)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        while any(self.sessions.values()) and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+
+        for websocket in list(self.sessions):
+            await self.close(websocket)
+
+    def install_signal_handler(self):
+        """
+        Wraps the SIGTERM handler installed by the server so draining runs first.
+        A second SIGTERM goes straight to the server.
+        """
+        loop = asyncio.get_running_loop()
+        original = signal.getsignal(signal.SIGTERM)
+        if not callable(original):
+            return
+
+        async def drain_then_exit(sig, frame):
+            await self.drain()
+            original(sig, frame)
+
+        def handle_sigterm(sig, frame):
+            if self.draining:
+                original(sig, frame)
+                return
+            self.draining = True
+            loop.call_soon_threadsafe(self._start, drain_then_exit(sig, frame))
+
+        signal.signal(signal.SIGTERM, handle_sigterm)
+
+    def _start(self, coroutine):
+        self._task = asyncio.ensure_future(coroutine)
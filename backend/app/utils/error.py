@@ -22,5 +22,8 @@ class Error(Exception):
         status_code=status.HTTP_404_NOT_FOUND,
         detail="History not found."
     )
-    
-    
\ No newline at end of file
+
+    INVALID_CURSOR = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid history cursor."
+    )
@@ -0,0 +1,217 @@
+import gzip
+import json
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+
+from beanie import PydanticObjectId
+from beanie.operators import In
+from bson import ObjectId
+from pydantic import BaseModel, Field
+
+from app import WRITE_BEHIND_BUFFER, WRITE_BEHIND_BATCH, WRITE_BEHIND_INTERVAL
+from app.data.models import ArchivedMessages, ChatMessage, Conversation
+from app.utils.write_behind import WriteBehind
+
+writer = WriteBehind(
+    max_buffer=WRITE_BEHIND_BUFFER,
+    batch_size=WRITE_BEHIND_BATCH,
+    interval=WRITE_BEHIND_INTERVAL
+)
+
+
+class MessageView(BaseModel):
+    """
+    Projection of ChatMessage with only the fields returned to clients.
+    """
+
+    id: PydanticObjectId = Field(alias="_id")
+    role: str
+    content: str
+
+
+def to_dict(message) -> Dict:
+    return {"role": message.role, "content": message.content}
+
+
+def to_page_item(message: MessageView) -> Dict:
+    return {"id": str(message.id), "role": message.role, "content": message.content}
+
+
+def pack(messages: List[MessageView]) -> bytes:
+    rows = [[str(message.id), message.role, message.content] for message in messages]
+    return gzip.compress(json.dumps(rows, ensure_ascii=False).encode())
+
+
+def unpack(run: ArchivedMessages) -> List[MessageView]:
+    rows = json.loads(gzip.decompress(run.data))
+    return [MessageView(_id=PydanticObjectId(id), role=role, content=content) for id, role, content in rows]
+
+
+def archived_runs(user_id: str, before: Optional[PydanticObjectId] = None):
+    query = ArchivedMessages.find(ArchivedMessages.user_id == user_id)
+    if before:
+        query = query.find(ArchivedMessages.first_id < before)
+    return query.sort(-ArchivedMessages.last_id)
+
+
+async def iter_archived(user_id: str, before: Optional[PydanticObjectId] = None) -> AsyncIterator[MessageView]:
+    """
+    Yields archived messages older than `before`, newest first, decompressing one run at a time.
+    """
+    async for run in archived_runs(user_id, before):
+        for message in reversed(unpack(run)):
+            if before is None or message.id < before:
+                yield message
+
+
+async def get_archived(user_id: str, limit: int, before: Optional[PydanticObjectId] = None) -> List[MessageView]:
+    messages = []
+    async for run in archived_runs(user_id, before):
+        messages.extend(
+            message for message in reversed(unpack(run)) if before is None or message.id < before
+        )
+        if len(messages) >= limit:
+            break
+    return messages[:limit]
+
+
+async def append_messages(user_id: str, messages: List[Dict]):
+    """
+    Appends messages to the user's history. While the write-behind queue runs they are
+    written with the next batch, otherwise right away with a single insert.
+    """
+    documents = [
+        ChatMessage(id=PydanticObjectId(), user_id=user_id, role=message["role"], content=message["content"])
+        for message in messages
+    ]
+    if writer.running:
+        await writer.enqueue(documents)
+    else:
+        await ChatMessage.insert_many(documents)
+
+
+async def has_messages(user_id: str) -> bool:
+    if writer.has_pending(user_id):
+        return True
+    return await ChatMessage.find_one(ChatMessage.user_id == user_id) is not None
+
+
+async def get_messages(user_id: str) -> List[Dict]:
+    await writer.flush_user(user_id)
+    messages = []
+    async for run in ArchivedMessages.find(ArchivedMessages.user_id == user_id).sort(+ArchivedMessages.first_id):
+        messages.extend(unpack(run))
+    messages += await ChatMessage.find(ChatMessage.user_id == user_id).sort(+ChatMessage.id).project(MessageView).to_list()
+    return [to_dict(message) for message in messages]
+
+
+def newest_first(user_id: str, before: Optional[PydanticObjectId] = None):
+    query = ChatMessage.find(ChatMessage.user_id == user_id)
+    if before:
+        query = query.find(ChatMessage.id < before)
+    return query.sort(-ChatMessage.id).project(MessageView)
+
+
+async def get_page(user_id: str, limit: int, before: Optional[PydanticObjectId] = None) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Returns up to `limit` messages older than `before`, newest first, and the cursor for the next page.
+
+    Archived messages are all older than the ones still in `messages`, so a page that
+    runs out of recent messages continues into the archive.
+    """
+    await writer.flush_user(user_id)
+    messages = await newest_first(user_id, before).limit(limit + 1).to_list()
+    if len(messages) <= limit:
+        messages += await get_archived(user_id, limit + 1 - len(messages), before)
+    next_cursor = str(messages[limit - 1].id) if len(messages) > limit else None
+    return [to_page_item(message) for message in messages[:limit]], next_cursor
+
+
+async def get_between(user_id: str, after: Optional[PydanticObjectId], until: PydanticObjectId, limit: int) -> List[MessageView]:
+    """
+    Returns up to `limit` messages newer than `after` and not newer than `until`, oldest first.
+    """
+    await writer.flush_user(user_id)
+    query = ChatMessage.find(ChatMessage.user_id == user_id, ChatMessage.id <= until)
+    if after:
+        query = query.find(ChatMessage.id > after)
+    return await query.sort(+ChatMessage.id).limit(limit).project(MessageView).to_list()
+
+
+async def get_recent(user_id: str, limit: int) -> List[MessageView]:
+    await writer.flush_user(user_id)
+    return await newest_first(user_id).limit(limit).to_list()
+
+
+async def iter_messages(user_id: str, before: Optional[PydanticObjectId] = None) -> AsyncIterator[Dict]:
+    await writer.flush_user(user_id)
+    async for message in newest_first(user_id, before):
+        yield to_page_item(message)
+    async for message in iter_archived(user_id, before):
+        yield to_page_item(message)
+
+
+async def clear_messages(user_id: str) -> bool:
+    """
+    Removes everything but the first message (the greeting). Returns False if the user has no history.
+    """
+    await writer.flush_user(user_id)
+    oldest_run = await ArchivedMessages.find(ArchivedMessages.user_id == user_id).sort(+ArchivedMessages.first_id).first_or_none()
+    if oldest_run:
+        greeting = unpack(oldest_run)[0]
+        await ChatMessage(
+            id=greeting.id,
+            user_id=user_id,
+            role=greeting.role,
+            content=greeting.content,
+            created_at=greeting.id.generation_time
+        ).save()
+        await ArchivedMessages.find(ArchivedMessages.user_id == user_id).delete()
+        first = greeting
+    else:
+        first = await ChatMessage.find(ChatMessage.user_id == user_id).sort(+ChatMessage.id).first_or_none()
+    if not first:
+        return False
+    await ChatMessage.find(ChatMessage.user_id == user_id, ChatMessage.id > first.id).delete()
+    return True
+
+
+async def delete_messages(user_id: str):
+    """
+    Removes the whole history of a deleted user, archive included.
+    """
+    await writer.flush_user(user_id)
+    await ChatMessage.find(ChatMessage.user_id == user_id).delete()
+    await ArchivedMessages.find(ArchivedMessages.user_id == user_id).delete()
+
+
+async def migrate_legacy_conversations():
+    """
+    Moves legacy Conversation documents to ChatMessage. Every worker runs this on start,
+    so each document is claimed with find_one_and_delete and migrated by one worker only.
+    The messages keep their order; their ids and created_at carry the time the
+    conversation started, which sorts them before anything written since.
+    """
+    collection = Conversation.get_motor_collection()
+    while True:
+        raw = await collection.find_one_and_delete({})
+        if raw is None:
+            return
+        started = raw["_id"].generation_time
+        documents = [
+            ChatMessage(
+                id=PydanticObjectId(raw["_id"].binary[:4] + ObjectId().binary[4:]),
+                user_id=raw["user_id"],
+                role=message["role"],
+                content=message["content"],
+                created_at=started
+            )
+            for message in raw.get("messages") or []
+        ]
+        try:
+            if documents:
+                await ChatMessage.insert_many(documents)
+        except Exception:
+            # undo a partial insert and put the document back for the next start
+            await ChatMessage.find(In(ChatMessage.id, [document.id for document in documents])).delete()
+            await collection.insert_one(raw)
+            raise
@@ -0,0 +1,81 @@
+import logging
+from typing import Dict, List
+
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+async def index_report(models) -> Dict[str, Dict[str, List[str]]]:
+    """
+    For every model's collection lists the declared indexes that do not exist and the
+    existing indexes that have not served a single operation since mongod started.
+    """
+    report = {}
+    for model in models:
+        collection = model.get_motor_collection()
+        existing = await collection.index_information()
+        # compared as ordered (field, direction) pairs: beanie's IndexModelField.fields
+        # holds only the field names, and a compound index in another field order is
+        # another index
+        existing_keys = {tuple(details["key"]) for details in existing.values()}
+        missing = [
+            index.name for index in model.get_settings().indexes or []
+            if tuple(index.index.document["key"].items()) not in existing_keys
+        ]
+        try:
+            unused = [
+                stats["name"] async for stats in collection.aggregate([{"$indexStats": {}}])
+                if stats["accesses"]["ops"] == 0 and stats["name"] != "_id_"
+            ]
+        except OperationFailure:
+            unused = []
+        report[collection.name] = {"missing": missing, "unused": unused}
+    return report
+
+
+async def reconcile_ttl_indexes(database, models) -> List[str]:
+    """
+    Brings the expireAfterSeconds of existing TTL indexes in line with the declared
+    ones through collMod. Run before init_beanie, which otherwise fails with
+    IndexOptionsConflict once a TTL setting changes between deploys.
+    """
+    changed = []
+    for model in models:
+        settings = getattr(model, "Settings", None)
+        declared = [
+            index.document for index in getattr(settings, "indexes", None) or []
+            if isinstance(index, IndexModel) and "expireAfterSeconds" in index.document
+        ]
+        if not declared:
+            continue
+        name = getattr(settings, "name", None) or model.__name__
+        existing = await database[name].index_information()
+        for document in declared:
+            key = list(document["key"].items())
+            for index_name, details in existing.items():
+                if details["key"] != key or "expireAfterSeconds" not in details:
+                    continue
+                if details["expireAfterSeconds"] == document["expireAfterSeconds"]:
+                    continue
+                await database.command({
+                    "collMod": name,
+                    "index": {"keyPattern": dict(key), "expireAfterSeconds": document["expireAfterSeconds"]}
+                })
+                logger.info(
+                    "changed expireAfterSeconds of %s.%s from %s to %s",
+                    name, index_name, details["expireAfterSeconds"], document["expireAfterSeconds"]
+                )
+                changed.append(f"{name}.{index_name}")
+    return changed
+
+
+async def verify_indexes(models) -> Dict[str, Dict[str, List[str]]]:
+    report = await index_report(models)
+    for collection, entry in report.items():
+        if entry["missing"]:
+            logger.warning("collection %s is missing indexes %s", collection, entry["missing"])
+        if entry["unused"]:
+            logger.info("collection %s has unused indexes %s", collection, entry["unused"])
+    return report
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator
+
+from gigachat import GigaChat
+from gigachat.models import Chat, ChatCompletion
+
+from app.utils.metrics import llm_first_token_seconds, llm_seconds, llm_tokens
+from app.utils.resilience import CircuitBreaker, LatencyWindow, LLMUnavailable, backoff, is_transient
+
+ca_bundle_file = r"app/russian_trusted_root_ca_pem.crt"
+
+logger = logging.getLogger(__name__)
+
+
+def count_tokens(usage):
+    if usage is not None:
+        llm_tokens.inc(usage.prompt_tokens, kind="prompt")
+        llm_tokens.inc(usage.completion_tokens, kind="completion")
+
+
+class LLMPool:
+    """
+    Long-lived GigaChat client shared by every assistant socket of the worker.
+
+    The underlying client keeps its OAuth token and its HTTP connections between
+    calls, the semaphore caps how many completions run upstream at once.
+
+    Every call has a deadline. An attempt is bounded by `timeout` (for streams: the
+    wait for each next chunk); transient failures are retried with jittered backoff
+    while the deadline allows, a stream only until its first chunk. With `hedge`
+    on, a completion still running after the recent p95 latency is raced against a
+    second identical request. Calls that fail for good trip the circuit breaker,
+    which then rejects calls with CircuitOpen until upstream recovers.
+
+    start() warms the client up in the background (OAuth token and a connection to
+    the API); `warm` tells the readiness probe when that, or any call, succeeded.
+    """
+
+    def __init__(
+        self,
+        credentials: str,
+        max_concurrency: int,
+        timeout: float,
+        deadline: float,
+        retries: int,
+        retry_backoff: float,
+        hedge: bool,
+        hedge_min_samples: int,
+        breaker: CircuitBreaker
+    ):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker
+        self.client = GigaChat(
+            credentials=credentials,
+            ca_bundle_file=ca_bundle_file,
+            verify_ssl_certs=False,
+            timeout=timeout
+        )
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.latencies = LatencyWindow()
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failures = 0
+        self.warm = False
+        self._warm_up_task = None
+
+    async def start(self):
+        self._warm_up_task = asyncio.create_task(self._warm_up())
+
+    async def _warm_up(self):
+        attempt = 0
+        while not self.warm:
+            try:
+                await asyncio.wait_for(self.client.aget_models(), self.timeout)
+                self.warm = True
+            except Exception as error:
+                logger.warning("GigaChat warm-up failed: %r", error)
+                await asyncio.sleep(backoff(attempt, 1.0, 30.0))
+                attempt += 1
+
+    async def chat(self, payload: Chat) -> ChatCompletion:
+        self.breaker.acquire()
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        try:
+            with llm_seconds.time(mode="chat"):
+                while True:
+                    try:
+                        completion = await self._attempt(payload, deadline)
+                        break
+                    except Exception as error:
+                        delay = self._retry_delay(error, attempt, deadline)
+                        if delay is None:
+                            self._give_up(error)
+                    attempt += 1
+                    self.retried += 1
+                    await asyncio.sleep(delay)
+        finally:
+            self.breaker.release()
+        self.breaker.success()
+        self.warm = True
+        count_tokens(completion.usage)
+        return completion
+
+    async def stream(self, payload: Chat) -> AsyncIterator[str]:
+        """
+        Yields the completion text piece by piece as GigaChat produces it.
+
+        The timeout applies to the wait for each next chunk, so a long answer that
+        keeps streaming is not cut off; the deadline bounds the wait for the first one.
+        """
+        self.breaker.acquire()
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        streamed = False
+        try:
+            while True:
+                try:
+                    async with self.semaphore:
+                        chunks = self.client.astream(payload)
+                        try:
+                            while True:
+                                timeout = self.timeout if streamed else min(self.timeout, deadline - time.monotonic())
+                                if timeout <= 0:
+                                    raise asyncio.TimeoutError
+                                try:
+                                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                                except StopAsyncIteration:
+                                    break
+                                # usage arrives with the last chunk
+                                count_tokens(chunk.usage)
+                                content = chunk.choices[0].delta.content if chunk.choices else None
+                                if content:
+                                    if not streamed:
+                                        llm_first_token_seconds.observe(time.perf_counter() - start, mode="stream")
+                                        streamed = True
+                                    yield content
+                        finally:
+                            await chunks.aclose()
+                    break
+                except Exception as error:
+                    # text already sent to the user cannot be taken back, so no retry after it
+                    delay = None if streamed else self._retry_delay(error, attempt, deadline)
+                    if delay is None:
+                        self._give_up(error)
+                attempt += 1
+                self.retried += 1
+                await asyncio.sleep(delay)
+            self.breaker.success()
+            self.warm = True
+        finally:
+            self.breaker.release()
+            llm_seconds.observe(time.perf_counter() - start, mode="stream")
+
+    async def _attempt(self, payload: Chat, deadline: float) -> ChatCompletion:
+        timeout = min(self.timeout, deadline - time.monotonic())
+        if timeout <= 0:
+            raise asyncio.TimeoutError
+        hedge_after = self.latencies.quantile(0.95) if self.hedge else None
+        if hedge_after is None or len(self.latencies.samples) < self.hedge_min_samples or hedge_after >= timeout:
+            return await asyncio.wait_for(self._send(payload), timeout)
+        return await self._hedged(payload, timeout, hedge_after)
+
+    async def _hedged(self, payload: Chat, timeout: float, hedge_after: float) -> ChatCompletion:
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout
+        tasks = [asyncio.ensure_future(self._send(payload))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            # a hedge must not queue behind other users' calls
+            if not done and not self.semaphore.locked():
+                self.hedged += 1
+                tasks.append(asyncio.ensure_future(self._send(payload)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, end - loop.time()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _send(self, payload: Chat) -> ChatCompletion:
+        async with self.semaphore:
+            start = time.perf_counter()
+            completion = await self.client.achat(payload)
+            self.latencies.add(time.perf_counter() - start)
+            return completion
+
+    def _retry_delay(self, error: Exception, attempt: int, deadline: float) -> float | None:
+        if not is_transient(error) or attempt >= self.retries:
+            return None
+        delay = backoff(attempt, self.retry_backoff)
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def _give_up(self, error: Exception):
+        if not is_transient(error):
+            raise error
+        self.failures += 1
+        self.breaker.failure()
+        raise LLMUnavailable(repr(error)) from error
+
+    def stats(self) -> dict:
+        p95 = self.latencies.quantile(0.95)
+        stats = {
+            "retried": self.retried,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "failures": self.failures,
+            "warm": int(self.warm),
+            "p95_seconds": round(p95, 3) if p95 is not None else 0.0,
+        }
+        stats.update({f"breaker_{key}": value for key, value in self.breaker.stats().items()})
+        return stats
+
+    async def close(self):
+        if self._warm_up_task is not None:
+            self._warm_up_task.cancel()
+        await self.client.aclose()
@@ -0,0 +1,36 @@
+import json
+import logging
+import random
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line; fields passed as `extra={"fields": {...}}` are
+    merged into it.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure(level: str):
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    logger = logging.getLogger("app")
+    logger.handlers = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+
+def sampled(rate: float) -> bool:
+    return rate >= 1 or random.random() < rate
+
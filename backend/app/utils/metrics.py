@@ -0,0 +1,237 @@
+import asyncio
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def render_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values: Dict[Tuple[str, ...], float] = {}
+        # Mongo command listeners update instruments from the driver's threads
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self.lock:
+            values = list(self.values.items())
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for key, value in values:
+            lines.append(f"{self.name}{render_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # per label set: bucket counts (the last one is +Inf), sum of observations
+        self.values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][position] += 1
+            entry[1][0] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self.lock:
+            values = [(key, (list(counts), list(total))) for key, (counts, total) in self.values.items()]
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                bucket = render_labels(self.labels, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+            lines.append(f"{self.name}_sum{render_labels(self.labels, key)} {total[0]}")
+            lines.append(f"{self.name}_count{render_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Metrics:
+    """
+    Process-local metrics in the Prometheus text format.
+
+    Counters and histograms are updated on the hot paths; the `stats()` dicts the
+    caches, pools and queues already keep are read as gauges at scrape time. With
+    several workers every worker reports its own numbers.
+    """
+
+    def __init__(self):
+        self.instruments: List = []
+        self.sources: List[Tuple[str, Callable[[], dict]]] = []
+
+    def counter(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> Counter:
+        counter = Counter(name, description, labels)
+        self.instruments.append(counter)
+        return counter
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        histogram = Histogram(name, description, labels, buckets)
+        self.instruments.append(histogram)
+        return histogram
+
+    def gauges(self, prefix: str, source: Callable[[], dict]):
+        """
+        Exposes every numeric field of `source()` as `<prefix>_<field>`, plus a
+        `<prefix>_hit_ratio` when the source counts hits and misses.
+        """
+        self.sources = [(name, fn) for name, fn in self.sources if name != prefix]
+        self.sources.append((prefix, source))
+
+    def render(self) -> str:
+        lines = []
+        for instrument in self.instruments:
+            lines.extend(instrument.render())
+        for prefix, source in self.sources:
+            stats = source()
+            if "hits" in stats and "misses" in stats:
+                lookups = stats["hits"] + stats["misses"]
+                stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+            for field, value in stats.items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"# TYPE {prefix}_{field} gauge")
+                    lines.append(f"{prefix}_{field} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+http_requests = metrics.counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+http_request_seconds = metrics.histogram(
+    "http_request_seconds", "HTTP request latency", ("method", "route")
+)
+ws_connections = metrics.counter("ws_connections_total", "Accepted assistant sockets")
+ws_messages = metrics.counter("ws_messages_total", "Questions received on assistant sockets")
+ws_message_seconds = metrics.histogram(
+    "ws_message_seconds", "Time from a question to its stored answer"
+)
+mongo_command_seconds = metrics.histogram(
+    "mongo_command_seconds", "MongoDB command latency", ("command",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+mongo_command_failures = metrics.counter(
+    "mongo_command_failures_total", "Failed MongoDB commands", ("command",)
+)
+llm_first_token_seconds = metrics.histogram(
+    "llm_first_token_seconds", "Time to the first GigaChat token", ("mode",)
+)
+llm_seconds = metrics.histogram("llm_seconds", "Total GigaChat call time", ("mode",))
+llm_tokens = metrics.counter("llm_tokens_total", "Tokens billed by GigaChat", ("kind",))
+event_loop_lag_seconds = metrics.histogram(
+    "event_loop_lag_seconds", "How late the event loop wakes up a sleeping task",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+
+
+class LoopLagMonitor:
+    """
+    Sleeps for `interval` in a loop and records how much later than requested it
+    woke up: the time other callbacks held the event loop.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            event_loop_lag_seconds.observe(max(0.0, loop.time() - start - self.interval))
+
+
+class MetricsMiddleware:
+    """
+    Counts and times HTTP requests by route template, so `/messages?before=...`
+    calls share one series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.paths: Dict[Callable, str] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = self.route(scope)
+            http_requests.inc(method=scope["method"], route=route, status=status)
+            http_request_seconds.observe(time.perf_counter() - start, method=scope["method"], route=route)
+
+    def route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if not self.paths:
+            self.paths = {route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")}
+        return self.paths.get(endpoint, "unmatched")
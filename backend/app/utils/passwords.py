@@ -0,0 +1,77 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+context_pass = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _hash(password: str) -> str:
+    return context_pass.hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return context_pass.verify(password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt outside the event loop.
+
+    Hashing happens in a thread pool (bcrypt releases the GIL) or, with
+    kind="process", in a process pool. At most `max_concurrency` calls are
+    submitted at once, the rest wait on the semaphore instead of piling up
+    in the executor queue.
+    """
+
+    def __init__(self, kind: str, workers: int, max_concurrency: int):
+        self.kind = kind
+        self.workers = workers
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self._executor: Executor | None = None
+        self.calls = 0
+        self.seconds = 0.0
+        self.logins = 0
+        self.failed_logins = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, func, *args):
+        async with self.semaphore:
+            started = time.perf_counter()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+            finally:
+                self.calls += 1
+                self.seconds += time.perf_counter() - started
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        verified = await self._run(_verify, password, hashed_password)
+        self.logins += 1
+        if not verified:
+            self.failed_logins += 1
+        return verified
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "logins": self.logins,
+            "failed_logins": self.failed_logins,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
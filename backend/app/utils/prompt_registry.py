@@ -0,0 +1,122 @@
+import hashlib
+import importlib
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+from gigachat.models import Chat, Messages, MessagesRole
+
+from app import RETRIEVAL_TOP_K
+from app.utils.retrieval import BM25Index, split_prompt
+
+AGE_BUCKETS = ((17, "до 18"), (24, "18-24"), (34, "25-34"), (49, "35-49"), (64, "50-64"))
+
+
+@dataclass(frozen=True)
+class RolePrompt:
+    role: str
+    content: str
+    temperature: float
+    max_tokens: int
+    version: str
+    instructions: str
+    index: BM25Index
+
+
+def age_bucket(age: int) -> str:
+    for upper, label in AGE_BUCKETS:
+        if age <= upper:
+            return label
+    return "65+"
+
+
+def audience(age: int, gender: str) -> str:
+    """
+    Who a rendered system prompt is personalised for; answers are only shared within one audience.
+    """
+    return f"{age_bucket(age)}/{gender}"
+
+
+class PromptRegistry:
+    """
+    Role prompts and their generation parameters, compiled once from app.utils.prompts.
+
+    Each prompt's knowledge base is indexed for retrieval and the rest of the prompt is
+    rendered once per (role, age bucket, gender); per request only the retrieved chunks
+    and context notes are spliced in. With RETRIEVAL_TOP_K=0 the full prompt is sent.
+    reload() re-reads the prompts module in this worker and gives changed roles a new version;
+    versions are content hashes, so workers that reload the same prompts agree on them.
+    The /system/prompts/reload endpoint broadcasts the reload to the other workers.
+    """
+
+    def __init__(self):
+        self.roles: Dict[str, RolePrompt] = {}
+        self._rendered: Dict[Tuple[str, str, str], Tuple[str, str]] = {}
+
+    def load(self):
+        # the prompts module is large, it is only imported once the registry is needed
+        prompts = importlib.import_module("app.utils.prompts")
+        roles = {}
+        for role, content in prompts.prompts.items():
+            params = prompts.generation[role]
+            instructions, chunks = split_prompt(content)
+            roles[role] = RolePrompt(
+                role=role,
+                content=content,
+                temperature=params["temperature"],
+                max_tokens=params["max_tokens"],
+                version=hashlib.sha256(f"{content}{params}".encode()).hexdigest()[:12],
+                instructions=instructions,
+                index=BM25Index(chunks)
+            )
+        self.roles = roles
+        self._rendered = {}
+
+    def reload(self) -> Dict[str, str]:
+        importlib.reload(importlib.import_module("app.utils.prompts"))
+        self.load()
+        return self.versions()
+
+    def versions(self) -> Dict[str, str]:
+        return {role: prompt.version for role, prompt in self.roles.items()}
+
+    def get(self, role: str) -> RolePrompt:
+        if not self.roles:
+            self.load()
+        return self.roles[role]
+
+    def render(self, role: str, age: int, gender: str) -> Tuple[str, str]:
+        """
+        Returns the system prompt text before and after the place where knowledge goes.
+        """
+        key = (role, age_bucket(age), gender)
+        rendered = self._rendered.get(key)
+        if rendered is None:
+            prompt = self.get(role)
+            tail = f"Учитывай возраст:{key[1]} и пол: {gender}"
+            if RETRIEVAL_TOP_K and prompt.index.chunks:
+                head, rest = prompt.instructions.split("{knowledge}", 1)
+                rendered = (head, rest + tail)
+            else:
+                rendered = (prompt.content + tail, "")
+            self._rendered[key] = rendered
+        return rendered
+
+    def system_message(self, role: str, age: int, gender: str, question: str = "", notes: Sequence[str] = ()) -> Messages:
+        head, tail = self.render(role, age, gender)
+        parts = [head]
+        if tail:
+            parts.extend(self.get(role).index.search(question, RETRIEVAL_TOP_K))
+            parts.append(tail)
+        parts.extend(notes)
+        return Messages(role=MessagesRole.SYSTEM, content="\n".join(parts))
+
+    def chat(self, role: str, age: int, gender: str, messages: List[Messages], question: str = "", notes: Sequence[str] = ()) -> Chat:
+        prompt = self.get(role)
+        return Chat(
+            messages=[self.system_message(role, age, gender, question, notes), *messages],
+            temperature=prompt.temperature,
+            max_tokens=prompt.max_tokens,
+        )
+
+
+registry = PromptRegistry()
@@ -330,4 +330,10 @@ prompts = {
         
                   '''
 }
-                 
+
+generation = {
+    "student": {"temperature": 0.8, "max_tokens": 10000},
+    "retraining": {"temperature": 0.4, "max_tokens": 10000},
+    "teacher": {"temperature": 0.6, "max_tokens": 10000},
+    "management": {"temperature": 0.2, "max_tokens": 10000},
+}
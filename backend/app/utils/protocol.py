@@ -0,0 +1,76 @@
+"""
+Frames sent over the assistant WebSocket when the client connects with ``?stream=1``
+or negotiates one of the ``SUBPROTOCOLS``.
+
+Every reply is a ``start`` frame, any number of ``delta`` frames carrying the next
+piece of text, and then either ``done`` with the full text or ``error``. A question
+refused by admission control gets a single ``busy`` frame instead.
+
+With ``?stream=1`` frames are JSON text and questions are sent as plain text. A
+negotiated subprotocol uses its encoding in both directions (``metrosha.json`` as
+text messages, ``metrosha.msgpack`` as binary ones) and questions are ``question``
+frames.
+"""
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+import orjson
+
+try:
+    import msgpack
+except ImportError:
+    # optional: without it only the JSON subprotocol is offered
+    msgpack = None
+
+
+def start(message_id: str) -> dict:
+    return {"type": "start", "id": message_id}
+
+
+def delta(message_id: str, content: str) -> dict:
+    return {"type": "delta", "id": message_id, "content": content}
+
+
+def done(message_id: str, content: str) -> dict:
+    return {"type": "done", "id": message_id, "content": content}
+
+
+def error(message_id: str, detail: str) -> dict:
+    return {"type": "error", "id": message_id, "detail": detail}
+
+
+def busy(detail: str, retry_after: float) -> dict:
+    return {"type": "busy", "detail": detail, "retry_after": round(retry_after, 1)}
+
+
+def question(content: str) -> dict:
+    return {"type": "question", "content": content}
+
+
+@dataclass(frozen=True)
+class Codec:
+    subprotocol: Optional[str]
+    binary: bool
+    encode: Callable[[dict], str | bytes]
+    decode: Optional[Callable[[str | bytes], dict]] = None
+
+
+def encode_json(frame: dict) -> str:
+    return orjson.dumps(frame).decode()
+
+
+STREAM_JSON = Codec(subprotocol=None, binary=False, encode=encode_json)
+
+SUBPROTOCOLS = {"metrosha.json": Codec("metrosha.json", False, encode_json, orjson.loads)}
+if msgpack is not None:
+    SUBPROTOCOLS["metrosha.msgpack"] = Codec("metrosha.msgpack", True, msgpack.packb, msgpack.unpackb)
+
+
+def negotiate(offered: List[str]) -> Optional[Codec]:
+    """
+    Picks the first subprotocol offered by the client that the server speaks.
+    """
+    for name in offered:
+        if name in SUBPROTOCOLS:
+            return SUBPROTOCOLS[name]
+    return None
@@ -0,0 +1,134 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+import httpx
+from gigachat.exceptions import ResponseError
+
+
+class LLMUnavailable(Exception):
+    """
+    GigaChat did not answer within the deadline and the retry budget.
+    """
+
+
+class CircuitOpen(LLMUnavailable):
+    def __init__(self, retry_after: float):
+        super().__init__("circuit open")
+        self.retry_after = retry_after
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Failures worth retrying and counting against upstream health: timeouts,
+    connection problems, throttling and server errors. Other 4xx answers are
+    our own fault and are raised as they are.
+    """
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError)):
+        return True
+    if isinstance(error, ResponseError) and len(error.args) > 1:
+        status = error.args[1]
+        return status == 429 or status >= 500
+    return False
+
+
+def backoff(attempt: int, base: float, cap: float = 10.0) -> float:
+    """
+    Exponential backoff with full jitter, so retries from many sockets spread out.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transient failures and rejects
+    calls for `reset_timeout` seconds; then one probe call is let through
+    (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def available(self) -> bool:
+        """
+        Whether a call would be let through, without taking the half-open probe slot.
+        """
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return self.retry_after() == 0
+        return not self.probing
+
+    def acquire(self):
+        if self.state == self.OPEN and self.retry_after() == 0:
+            self.state = self.HALF_OPEN
+            self.probing = False
+        if self.state == self.OPEN or (self.state == self.HALF_OPEN and self.probing):
+            self.rejected += 1
+            raise CircuitOpen(self.retry_after() or self.reset_timeout)
+        if self.state == self.HALF_OPEN:
+            self.probing = True
+
+    def success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probing = False
+
+    def failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.probing = False
+
+    def release(self):
+        """
+        Frees the half-open probe slot after a call that proved nothing either way.
+        """
+        self.probing = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "open": int(self.state != self.CLOSED),
+            "consecutive_failures": self.failures,
+            "retry_after": round(self.retry_after(), 1) if self.state == self.OPEN else 0.0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class LatencyWindow:
+    """
+    The latencies of the last `size` successful calls, to decide when a call is
+    slow enough to hedge.
+    """
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
@@ -0,0 +1,157 @@
+"""
+Cache of assistant answers to repeated, self-contained questions: the assistant
+only consults it for a question asked with no earlier user turns and no summary
+in the conversation, in practice a user's first question.
+
+Answers are keyed by role, role prompt version, audience (the age bucket and
+gender the system prompt is personalised for) and normalised question, so
+editing or reloading a role's prompt makes its old answers unreachable. Lookup
+is an exact match first, then the most similar of the last RESPONSE_CACHE_SCAN_LIMIT
+questions stored for the same role, version and audience by character-trigram
+cosine similarity, so a miss costs a bounded scan. Misses in memory fall through to
+the Mongo-backed CachedAnswer collection.
+"""
+
+import math
+import re
+from collections import Counter, OrderedDict
+from typing import Dict, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from app import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_SIMILARITY, RESPONSE_CACHE_MIN_LENGTH, RESPONSE_CACHE_SCAN_LIMIT
+from app.data.models import CachedAnswer
+from app.utils.cache import TTLCache
+
+_punctuation = re.compile(r"[^\w\s]")
+_spaces = re.compile(r"\s+")
+
+
+def normalise(text: str) -> str:
+    text = text.lower().replace("ё", "е")
+    text = _punctuation.sub(" ", text)
+    return _spaces.sub(" ", text).strip()
+
+
+def trigrams(text: str) -> Counter:
+    padded = f"  {text} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def cosine(a: Counter, b: Counter) -> float:
+    dot = sum(count * b[gram] for gram, count in a.items() if gram in b)
+    if not dot:
+        return 0.0
+    return dot / (math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values())))
+
+
+class ResponseCache:
+    def __init__(self, maxsize: int, ttl: float, similarity: float, min_length: int, scan_limit: int):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.similarity = similarity
+        self.min_length = min_length
+        self.scan_limit = scan_limit
+        # per (role, version, audience): trigram vectors of the most recently stored
+        # questions, the only ones compared for a similar hit
+        self.candidates: Dict[Tuple[str, str, str], OrderedDict] = {}
+        self.hits = 0
+        self.similar_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def cacheable(self, question: str) -> bool:
+        return len(question) >= self.min_length
+
+    def _remember(self, scope: Tuple[str, str, str], question: str, vector: Counter):
+        candidates = self.candidates.setdefault(scope, OrderedDict())
+        candidates[question] = vector
+        candidates.move_to_end(question)
+        while len(candidates) > self.scan_limit:
+            candidates.popitem(last=False)
+
+    async def lookup(self, role: str, version: str, audience: str, text: str) -> Optional[str]:
+        question = normalise(text)
+        if not self.cacheable(question):
+            return None
+
+        scope = (role, version, audience)
+        answer = self.entries.get((*scope, question))
+        if answer is not None:
+            self.hits += 1
+            return answer
+
+        vector = trigrams(question)
+        candidates = self.candidates.get(scope, {})
+        best, best_score = None, self.similarity
+        for candidate, candidate_vector in candidates.items():
+            score = cosine(vector, candidate_vector)
+            if score >= best_score:
+                best, best_score = candidate, score
+        if best is not None:
+            answer = self.entries.get((*scope, best))
+            if answer is not None:
+                self.similar_hits += 1
+                return answer
+            # expired or evicted from the cache since it was stored
+            del candidates[best]
+
+        stored = await CachedAnswer.find_one(
+            CachedAnswer.role == role,
+            CachedAnswer.version == version,
+            CachedAnswer.audience == audience,
+            CachedAnswer.question == question
+        )
+        if stored:
+            self.entries.set((*scope, question), stored.answer)
+            self._remember(scope, question, vector)
+            self.persistent_hits += 1
+            return stored.answer
+
+        self.misses += 1
+        return None
+
+    async def store(self, role: str, version: str, audience: str, text: str, answer: str):
+        question = normalise(text)
+        if not self.cacheable(question):
+            return
+        self.entries.set((role, version, audience, question), answer)
+        self._remember((role, version, audience), question, trigrams(question))
+        try:
+            await CachedAnswer(role=role, version=version, audience=audience, question=question, answer=answer).insert()
+        except DuplicateKeyError:
+            # another worker answered the same question first
+            pass
+
+    def discard_stale(self, versions: Dict[str, str]):
+        """
+        Drops this worker's in-memory answers generated with prompt versions that are no longer current.
+        """
+        self.entries.discard_where(lambda key, value: versions.get(key[0]) != key[1])
+        for scope in [scope for scope in self.candidates if versions.get(scope[0]) != scope[1]]:
+            del self.candidates[scope]
+
+    async def purge_stale(self, versions: Dict[str, str]):
+        """
+        Drops answers generated with prompt versions that are no longer current, the stored ones included.
+        """
+        self.discard_stale(versions)
+        for role, version in versions.items():
+            await CachedAnswer.find(CachedAnswer.role == role, CachedAnswer.version != version).delete()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+        }
+
+
+response_cache = ResponseCache(
+    maxsize=RESPONSE_CACHE_SIZE,
+    ttl=RESPONSE_CACHE_TTL,
+    similarity=RESPONSE_CACHE_SIMILARITY,
+    min_length=RESPONSE_CACHE_MIN_LENGTH,
+    scan_limit=RESPONSE_CACHE_SCAN_LIMIT
+)
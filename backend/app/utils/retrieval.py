@@ -0,0 +1,105 @@
+"""
+In-process BM25 index over the knowledge base part of the role prompts.
+
+Each role prompt is split into its instructions (persona, tasks, style, format,
+examples) and the site knowledge listed after KNOWLEDGE_START. The knowledge is
+cut into small chunks and only the chunks relevant to the question are sent to
+the model.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import List, Tuple
+
+KNOWLEDGE_START = "Сайт содержит информацию о:"
+KNOWLEDGE_END = "ТВОИ ЗАДАЧИ:"
+MAX_CHUNK_LENGTH = 800
+STEM_LENGTH = 5
+
+_words = re.compile(r"\w+")
+_sentences = re.compile(r"(?<=[.;])\s+")
+
+
+def terms(text: str) -> List[str]:
+    """
+    Lowercased words cut to STEM_LENGTH characters: a crude stemmer that is good
+    enough to match Russian word forms ("расписание", "расписания").
+    """
+    return [word[:STEM_LENGTH] for word in _words.findall(text.lower().replace("ё", "е"))]
+
+
+def split_long(text: str) -> List[str]:
+    if len(text) <= MAX_CHUNK_LENGTH:
+        return [text]
+    pieces, current = [], ""
+    for sentence in _sentences.split(text):
+        if current and len(current) + len(sentence) > MAX_CHUNK_LENGTH:
+            pieces.append(current)
+            current = ""
+        current = f"{current} {sentence}".strip()
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_prompt(prompt: str) -> Tuple[str, List[str]]:
+    """
+    Returns the prompt without its knowledge block and the knowledge as chunks.
+    Prompts without a knowledge block are returned unchanged with no chunks.
+    """
+    stripped = [line.strip() for line in prompt.split("\n")]
+    start = next((i for i, line in enumerate(stripped) if KNOWLEDGE_START in line), None)
+    if start is None or KNOWLEDGE_END not in stripped[start:]:
+        return prompt, []
+    end = stripped.index(KNOWLEDGE_END, start)
+
+    chunks, heading = [], ""
+    for line in stripped[start + 1:end]:
+        if not line:
+            continue
+        if line.endswith(":") and len(line) < 60:
+            heading = line
+        elif line.startswith("+") and chunks:
+            chunks[-1] = f"{chunks[-1]} {line}"
+        else:
+            chunks.append(f"{heading} {line}".strip())
+
+    instructions = "\n".join(stripped[:start + 1] + ["{knowledge}"] + stripped[end:])
+    return instructions, [piece for chunk in chunks for piece in split_long(chunk)]
+
+
+class BM25Index:
+    def __init__(self, chunks: List[str], k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.documents = [Counter(terms(chunk)) for chunk in chunks]
+        self.lengths = [sum(document.values()) for document in self.documents]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+        frequencies = Counter(term for document in self.documents for term in document)
+        self.idf = {
+            term: math.log(1 + (len(chunks) - count + 0.5) / (count + 0.5))
+            for term, count in frequencies.items()
+        }
+
+    def score(self, query: List[str], position: int) -> float:
+        document = self.documents[position]
+        norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / self.average_length)
+        total = 0.0
+        for term in query:
+            count = document.get(term)
+            if count:
+                total += self.idf[term] * count * (self.k1 + 1) / (count + norm)
+        return total
+
+    def search(self, query: str, k: int) -> List[str]:
+        """
+        Returns up to k best matching chunks in their original order.
+        """
+        query_terms = [term for term in set(terms(query)) if term in self.idf]
+        if not query_terms:
+            return []
+        scores = [(self.score(query_terms, position), position) for position in range(len(self.chunks))]
+        best = sorted((item for item in scores if item[0] > 0), reverse=True)[:k]
+        return [self.chunks[position] for _, position in sorted(best, key=lambda item: item[1])]
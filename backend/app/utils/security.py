@@ -1,52 +1,72 @@
 from typing import Annotated
 
-from app import ALGORITHM, SECRET_KEY
-from app.data.models import User, TokenData
+from app import (
+    ALGORITHM, SECRET_KEY, PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL,
+    PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_CONCURRENCY
+)
+from app.data.models import User, UserPrincipal, TokenData
 from app.utils.error import Error
+from app.utils.cache import TTLCache
+from app.utils.passwords import PasswordHasher
 from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 
 from jwt.exceptions import InvalidTokenError
 import jwt
+import time
 
-context_pass = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher(
+    kind=PASSWORD_HASH_EXECUTOR,
+    workers=PASSWORD_HASH_WORKERS,
+    max_concurrency=PASSWORD_HASH_CONCURRENCY
+)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/user/login")
 
-def verify_password(plain_password, hashed_password):
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
 
-    return context_pass.verify(plain_password, hashed_password)
+async def hash_password(plain_password):
+
+    return await password_hasher.hash(plain_password)
+
+async def verify_password(plain_password, hashed_password):
+
+    return await password_hasher.verify(plain_password, hashed_password)
+
+async def load_principal(token: str, algorithm: str) -> UserPrincipal:
+    """
+    Resolves a JWT to its user, reusing the result for PRINCIPAL_CACHE_TTL seconds
+    (never past the token expiry). Entries are dropped by invalidate_principal when
+    the user changes; on other workers they simply age out.
+    """
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
     try:
-        payload = jwt.decode(str(token), str(SECRET_KEY), algorithms=[ALGORITHM])
+        payload = jwt.decode(str(token), str(SECRET_KEY), algorithms=[algorithm])
         username: str = payload.get("sub")
         if username is None:
             raise Error.UNAUTHORIZED_INVALID
         token_data = TokenData(username=username)
     except InvalidTokenError:
         raise Error.UNAUTHORIZED_INVALID
-    
-    user = await User.find_one(User.email == token_data.username, fetch_links=True)
+
+    user = await User.find_one(User.email == token_data.username, projection_model=UserPrincipal)
     if user is None:
         raise Error.UNAUTHORIZED_INVALID
-    
+
+    ttl = PRINCIPAL_CACHE_TTL
+    if payload.get("exp"):
+        ttl = min(ttl, payload["exp"] - time.time())
+    principal_cache.set(token, user, ttl)
     return user
 
-async def get_current_user_websocket(token: str):
-    try:
-        payload = jwt.decode(str(token), str(SECRET_KEY), algorithms=["HS256"])
-        username: str = payload.get("sub")
+def invalidate_principal(email: str):
+    principal_cache.discard_where(lambda token, principal: principal.email == email)
 
-        if username is None:
-            raise Error.UNAUTHORIZED_INVALID
-    except InvalidTokenError:
-        raise Error.UNAUTHORIZED_INVALID
-    
-    user = await User.find_one(User.email == username, fetch_links=True)
-    if user is None:
-        raise Error.UNAUTHORIZED_INVALID
-    
-    return user
-        
\ No newline at end of file
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> UserPrincipal:
+    return await load_principal(token, ALGORITHM)
+
+async def get_current_user_websocket(token: str) -> UserPrincipal:
+    return await load_principal(token, "HS256")
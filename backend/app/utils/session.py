@@ -0,0 +1,52 @@
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from app import SESSION_TTL
+from app.data.models import User, UserPrincipal
+
+
+@dataclass
+class AssistantSession:
+    """
+    What the assistant loop needs to know about the user, loaded once per connection.
+
+    `version` is the hub's invalidation counter for the user at load time; when
+    change_user bumps it the session is reloaded before the next question. The hub
+    only hears of changes made through another worker over a shared backplane, so
+    a session is also reloaded once it is older than SESSION_TTL seconds.
+    """
+
+    user_id: str
+    role: str
+    age: int
+    gender: str
+    version: int
+    loaded_at: float = field(default_factory=time.monotonic)
+
+    @classmethod
+    def from_principal(cls, principal: UserPrincipal, version: int) -> "AssistantSession":
+        return cls(
+            user_id=str(principal.id),
+            role=str(principal.role.value),
+            age=principal.age,
+            gender=str(principal.gender.value),
+            version=version
+        )
+
+    def stale(self, version: int) -> bool:
+        return version != self.version or time.monotonic() - self.loaded_at >= SESSION_TTL
+
+    async def refresh(self, version: int) -> bool:
+        """
+        Reloads the profile. Returns False if the user no longer exists.
+        """
+        principal = await User.find_one(User.id == uuid.UUID(self.user_id), projection_model=UserPrincipal)
+        if principal is None:
+            return False
+        self.role = str(principal.role.value)
+        self.age = principal.age
+        self.gender = str(principal.gender.value)
+        self.version = version
+        self.loaded_at = time.monotonic()
+        return True
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+Emit = Callable[[dict], Awaitable[None]]
+
+
+class Flight:
+    """
+    One upstream call whose frames are fanned out to every socket waiting for it.
+    Sockets that join late first get the frames sent so far, with the deltas merged.
+    """
+
+    def __init__(self):
+        self.emits: List[Emit] = []
+        self.frames: List[dict] = []
+        self.text = ""
+        self.message_id = None
+        self.lock = asyncio.Lock()
+        self.task = None
+
+    async def emit(self, frame: dict):
+        async with self.lock:
+            if frame["type"] == "delta":
+                self.message_id = frame["id"]
+                self.text += frame["content"]
+            else:
+                self.frames.append(frame)
+            for emit in list(self.emits):
+                try:
+                    await emit(frame)
+                except Exception:
+                    # one subscriber's dead socket must not fail the call for the others
+                    logger.warning("dropping a subscriber of a shared call", exc_info=True)
+                    self.emits.remove(emit)
+
+    async def join(self, emit: Emit):
+        async with self.lock:
+            for frame in self.frames:
+                await emit(frame)
+            if self.text:
+                await emit({"type": "delta", "id": self.message_id, "content": self.text})
+            self.emits.append(emit)
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent requests into one call.
+
+    The call runs in its own task, so it completes for the sockets still waiting even
+    if the socket that started it goes away.
+    """
+
+    def __init__(self):
+        self.flights: Dict[Hashable, Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, emit: Emit, call: Callable[[Emit], Awaitable]) -> Tuple[object, bool]:
+        """
+        Returns the result of the call and whether this caller started it.
+        """
+        flight = self.flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = Flight()
+            self.flights[key] = flight
+            flight.emits.append(emit)
+            flight.task = asyncio.create_task(call(flight.emit))
+            flight.task.add_done_callback(lambda _: self.flights.pop(key, None))
+            self.calls += 1
+        else:
+            await flight.join(emit)
+            self.coalesced += 1
+        try:
+            return await asyncio.shield(flight.task), leader
+        finally:
+            if emit in flight.emits:
+                flight.emits.remove(emit)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self.flights), "calls": self.calls, "coalesced": self.coalesced}
+
+
+singleflight = SingleFlight()
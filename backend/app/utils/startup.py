@@ -0,0 +1,44 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """
+    How long each step of this worker's startup took, from the first import of the
+    `app` package to the moment it can take requests, against a time budget.
+    """
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.phases: Dict[str, float] = {}
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def report(self) -> dict:
+        total = sum(self.phases.values())
+        return {
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+            "total_ms": round(total * 1000, 1),
+            "budget_ms": round(self.budget * 1000, 1),
+            "over_budget": total > self.budget,
+        }
+
+    def log(self):
+        report = self.report()
+        if report["over_budget"]:
+            logger.warning("startup over budget", extra={"fields": report})
+        else:
+            logger.info("startup", extra={"fields": report})
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from collections import Counter, deque
+from typing import List
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from app.data.models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class WriteBehind:
+    """
+    Buffers chat messages from all sockets and writes them with one insert_many per batch.
+
+    A batch is written when `batch_size` messages are waiting or every `interval`
+    seconds. The buffer holds at most `max_buffer` messages, enqueue waits for room
+    beyond that. Message ids are assigned at enqueue time, so history order does not
+    depend on when a batch lands. Readers call flush_user first to see their own writes.
+    """
+
+    def __init__(self, max_buffer: int, batch_size: int, interval: float):
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.interval = interval
+        self.buffer: deque = deque()
+        self.pending = Counter()
+        self.running = False
+        self.flushes = 0
+        self.written = 0
+        self.failures = 0
+        self._room = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    async def start(self):
+        self.running = True
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        # the loop is stopped between batches rather than cancelled, so no batch
+        # is lost halfway through its write
+        self.running = False
+        self._wakeup.set()
+        if self._task:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def enqueue(self, messages: List[ChatMessage]):
+        while len(self.buffer) + len(messages) > self.max_buffer and self.buffer:
+            self._room.clear()
+            self._wakeup.set()
+            await self._room.wait()
+        for message in messages:
+            self.buffer.append(message)
+            self.pending[message.user_id] += 1
+        if len(self.buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def has_pending(self, user_id: str) -> bool:
+        return self.pending[user_id] > 0
+
+    async def flush_user(self, user_id: str):
+        if self.has_pending(user_id):
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            while self.buffer:
+                batch = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+                failed = await self._write(batch)
+                failed_ids = {id(message) for message in failed}
+                for message in batch:
+                    if id(message) not in failed_ids:
+                        self.pending[message.user_id] -= 1
+                        if not self.pending[message.user_id]:
+                            del self.pending[message.user_id]
+                self._room.set()
+                if failed:
+                    self.buffer.extendleft(reversed(failed))
+                    return
+
+    async def _write(self, batch: List[ChatMessage]) -> List[ChatMessage]:
+        """
+        Inserts the batch and returns the messages that still have to be written.
+        """
+        try:
+            await ChatMessage.insert_many(batch, ordered=False)
+        except BulkWriteError as error:
+            # duplicates are messages a failed attempt had already written
+            failed = {
+                write_error["index"] for write_error in error.details["writeErrors"]
+                if write_error["code"] != DUPLICATE_KEY
+            }
+            batch_failed = [message for index, message in enumerate(batch) if index in failed]
+        except PyMongoError:
+            logger.exception("writing %s chat messages failed", len(batch))
+            batch_failed = batch
+        else:
+            batch_failed = []
+        self.flushes += 1
+        self.written += len(batch) - len(batch_failed)
+        if batch_failed:
+            self.failures += 1
+        return batch_failed
+
+    async def _run(self):
+        delay = self.interval
+        while self.running:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self.running:
+                break
+            before = self.failures
+            await self.flush()
+            # after a failed write wait longer, unless woken up (a full buffer, close)
+            delay = min(5, self.interval * 10) if self.failures > before else self.interval
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self.buffer),
+            "flushes": self.flushes,
+            "written": self.written,
+            "failures": self.failures,
+        }
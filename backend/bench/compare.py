@@ -0,0 +1,63 @@
+"""
+Compares two bench.run reports phase by phase:
+
+    python -m bench.compare before.json after.json [--fail-above 10]
+
+Exits with status 1 when a phase's p95 latency grew by more than --fail-above percent.
+"""
+import argparse
+import json
+import sys
+
+FIELDS = (
+    ("throughput", ("throughput",)),
+    ("p50 ms", ("latency_ms", "p50")),
+    ("p95 ms", ("latency_ms", "p95")),
+    ("p99 ms", ("latency_ms", "p99")),
+    ("mongo ops", ("mongo_ops_per_op",)),
+    ("loop lag p99 ms", ("loop_lag_ms", "p99")),
+    ("errors", ("errors",)),
+)
+
+
+def lookup(phase: dict, path: tuple) -> float:
+    for key in path:
+        phase = phase.get(key, {})
+    return phase if isinstance(phase, (int, float)) else 0.0
+
+
+def change(before: float, after: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--fail-above", type=float, help="allowed p95 regression in percent")
+    args = parser.parse_args()
+
+    with open(args.before, encoding="utf-8") as file:
+        before = json.load(file)["phases"]
+    with open(args.after, encoding="utf-8") as file:
+        after = json.load(file)["phases"]
+
+    regressions = []
+    for name in before.keys() & after.keys():
+        print(name)
+        for label, path in FIELDS:
+            old, new = lookup(before[name], path), lookup(after[name], path)
+            print(f"  {label:<16}{old:>12}{new:>12}{change(old, new):>10}")
+        old_p95, new_p95 = lookup(before[name], ("latency_ms", "p95")), lookup(after[name], ("latency_ms", "p95"))
+        if args.fail_above is not None and old_p95 and (new_p95 - old_p95) / old_p95 * 100 > args.fail_above:
+            regressions.append(name)
+
+    if regressions:
+        print(f"p95 regressed by more than {args.fail_above}% in: {', '.join(sorted(regressions))}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+A stand-in for the GigaChat API with configurable latency, used by bench.run.
+
+    FAKE_LLM_LATENCY      seconds before the first token (default 0.5)
+    FAKE_LLM_CHUNKS       number of streamed chunks (default 20)
+    FAKE_LLM_CHUNK_DELAY  seconds between chunks (default 0.02)
+
+Non-streaming calls answer after the first-token latency plus all chunk delays,
+so both modes take equally long in total.
+"""
+import asyncio
+import json
+import time
+from os import getenv
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+LATENCY = float(getenv("FAKE_LLM_LATENCY", 0.5))
+CHUNKS = int(getenv("FAKE_LLM_CHUNKS", 20))
+CHUNK_DELAY = float(getenv("FAKE_LLM_CHUNK_DELAY", 0.02))
+
+app = FastAPI()
+
+
+def usage(payload: dict) -> dict:
+    prompt = sum(len(message.get("content") or "") for message in payload["messages"]) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": CHUNKS, "total_tokens": prompt + CHUNKS}
+
+
+@app.post("/api/v2/oauth")
+async def oauth() -> dict:
+    return {"access_token": "bench", "expires_at": int((time.time() + 1800) * 1000)}
+
+
+@app.get("/api/v1/models")
+async def models() -> dict:
+    return {"data": [{"id": "GigaChat", "object": "model", "owned_by": "bench"}], "object": "list"}
+
+
+@app.post("/api/v1/chat/completions")
+async def completions(request: Request):
+    payload = await request.json()
+    created = int(time.time())
+    if payload.get("stream"):
+        return StreamingResponse(stream(payload, created), media_type="text/event-stream")
+
+    await asyncio.sleep(LATENCY + CHUNK_DELAY * CHUNKS)
+    return {
+        "choices": [{
+            "message": {"role": "assistant", "content": " ".join(["слово"] * CHUNKS)},
+            "index": 0,
+            "finish_reason": "stop"
+        }],
+        "created": created,
+        "model": "GigaChat",
+        "usage": usage(payload),
+        "object": "chat.completion"
+    }
+
+
+async def stream(payload: dict, created: int):
+    await asyncio.sleep(LATENCY)
+    for index in range(CHUNKS):
+        chunk = {
+            "choices": [{"delta": {"role": "assistant", "content": "слово "}, "index": 0}],
+            "created": created,
+            "model": "GigaChat",
+            "object": "chat.completion"
+        }
+        if index == CHUNKS - 1:
+            chunk["choices"][0]["finish_reason"] = "stop"
+            chunk["usage"] = usage(payload)
+        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        await asyncio.sleep(CHUNK_DELAY)
+    yield "data: [DONE]\n\n"
@@ -0,0 +1,340 @@
+"""
+Load benchmark for the hot paths: sign-up, login, get_current_user, the
+assistant socket and history reads.
+
+Starts the fake GigaChat (bench.fake_gigachat) and the application as
+subprocesses, drives them with concurrent REST and WebSocket clients and writes
+one JSON document per run:
+
+    cd backend
+    python -m bench.run --users 50 --messages 5 --rest-clients 20 --out before.json
+    python -m bench.compare before.json after.json
+
+MongoDB must be reachable at --mongo (a throwaway database: it is dropped before
+the run), e.g. `docker compose up mongo`. Mongo operations per request and event
+loop lag are taken from the application's /api/system/metrics, scraped before
+and after every phase.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import urllib.parse
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import httpx
+import pymongo
+import websockets
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "mean": round(sum(values) / len(values), 2) if values else 0.0,
+        "p50": round(percentile(values, 0.50), 2),
+        "p95": round(percentile(values, 0.95), 2),
+        "p99": round(percentile(values, 0.99), 2),
+        "max": round(max(values), 2) if values else 0.0,
+    }
+
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            series, _, value = line.rpartition(" ")
+            samples[series] = float(value)
+    return samples
+
+
+def delta(before: Dict[str, float], after: Dict[str, float], prefix: str) -> Dict[str, float]:
+    return {
+        series: value - before.get(series, 0.0)
+        for series, value in after.items() if series.startswith(prefix)
+    }
+
+
+def histogram_quantile(q: float, buckets: Dict[str, float]) -> float:
+    """
+    Estimates a quantile from `<name>_bucket{le="..."}` deltas the way Prometheus does.
+    """
+    bounds = sorted(
+        (float(series.rsplit('le="', 1)[1].rstrip('"}')), count) for series, count in buckets.items()
+    )
+    if not bounds or bounds[-1][1] == 0:
+        return 0.0
+    rank = q * bounds[-1][1]
+    lower, below = 0.0, 0.0
+    for bound, cumulative in bounds:
+        if cumulative >= rank:
+            if bound == float("inf"):
+                return lower
+            return lower + (bound - lower) * (rank - below) / max(cumulative - below, 1)
+        lower, below = bound, cumulative
+    return lower
+
+
+class Phase:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.first_tokens: List[float] = []
+        self.errors = 0
+
+    async def timed(self, call: Callable[[], Awaitable]):
+        start = time.perf_counter()
+        try:
+            await call()
+        except Exception:
+            self.errors += 1
+        else:
+            self.latencies.append((time.perf_counter() - start) * 1000)
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.base = f"http://127.0.0.1:{args.port}"
+        self.tokens: List[Tuple[str, str]] = []
+        self.processes: List[subprocess.Popen] = []
+
+    def start(self):
+        llm_env = dict(
+            os.environ,
+            FAKE_LLM_LATENCY=str(self.args.llm_latency),
+            FAKE_LLM_CHUNKS=str(self.args.llm_chunks),
+            FAKE_LLM_CHUNK_DELAY=str(self.args.llm_chunk_delay)
+        )
+        self.spawn(["bench.fake_gigachat:app", "--port", str(self.args.llm_port)], llm_env)
+
+        llm = f"http://127.0.0.1:{self.args.llm_port}"
+        app_env = dict(
+            os.environ,
+            MONGO_DSN=self.args.mongo,
+            SECRET_KEY=os.environ.get("SECRET_KEY", "bench"),
+            ALGORITHM=os.environ.get("ALGORITHM", "HS256"),
+            GIGA_KEY="YmVuY2g6YmVuY2g=",
+            GIGACHAT_BASE_URL=f"{llm}/api/v1",
+            GIGACHAT_AUTH_URL=f"{llm}/api/v2/oauth",
+            RATE_LIMIT_USER_PER_MINUTE="1000000",
+            RATE_LIMIT_USER_BURST="1000000",
+            RATE_LIMIT_ROLE_PER_MINUTE="1000000",
+            RATE_LIMIT_ROLE_BURST="1000000",
+            LOG_LEVEL="WARNING"
+        )
+        self.spawn(["app.main:app", "--port", str(self.args.port), "--log-level", "warning"], app_env)
+
+    def spawn(self, arguments: List[str], env: dict):
+        self.processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", *arguments, "--host", "127.0.0.1"], env=env
+        ))
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait(timeout=30)
+
+    async def wait_ready(self, client: httpx.AsyncClient):
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/api/system/ready")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+        raise RuntimeError("the application did not start within 60 seconds")
+
+    async def scrape(self, client: httpx.AsyncClient) -> Dict[str, float]:
+        return parse_metrics((await client.get("/api/system/metrics")).text)
+
+    async def run_phase(
+        self,
+        client: httpx.AsyncClient,
+        phase: Phase,
+        workers: List[Callable[[], Awaitable]]
+    ) -> dict:
+        before = await self.scrape(client)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for worker in workers))
+        seconds = time.perf_counter() - start
+        # let the write-behind queue flush what the phase enqueued
+        await asyncio.sleep(1)
+        after = await self.scrape(client)
+
+        operations = len(phase.latencies) + phase.errors
+        mongo_ops = sum(
+            value for series, value in delta(before, after, "mongo_command_seconds_count").items()
+        )
+        lag = delta(before, after, "event_loop_lag_seconds_bucket")
+        lag_count = delta(before, after, "event_loop_lag_seconds_count")
+        lag_sum = delta(before, after, "event_loop_lag_seconds_sum")
+        samples = sum(lag_count.values())
+        result = {
+            "operations": operations,
+            "errors": phase.errors,
+            "seconds": round(seconds, 3),
+            "throughput": round(operations / seconds, 2) if seconds else 0.0,
+            "latency_ms": summarize(phase.latencies),
+            "mongo_ops_per_op": round(mongo_ops / max(operations, 1), 2),
+            "loop_lag_ms": {
+                "mean": round(sum(lag_sum.values()) / samples * 1000, 2) if samples else 0.0,
+                "p99": round(histogram_quantile(0.99, lag) * 1000, 2),
+            },
+        }
+        if phase.first_tokens:
+            result["first_token_ms"] = summarize(phase.first_tokens)
+        return result
+
+    async def sign_up(self, client: httpx.AsyncClient) -> dict:
+        phase = Phase("sign_up")
+        queue = list(range(self.args.users))
+
+        async def worker():
+            while queue:
+                index = queue.pop()
+                email = f"bench{index}@example.com"
+
+                async def call():
+                    response = await client.post("/api/user/create", json={
+                        "first_name": "Bench",
+                        "last_name": str(index),
+                        "password": "bench-password",
+                        "email": email,
+                        "role": "student",
+                        "age": 20,
+                        "gender": "male"
+                    })
+                    response.raise_for_status()
+                    self.tokens.append((email, response.json()["user_token"]))
+
+                await phase.timed(call)
+
+        return await self.run_phase(client, phase, [worker] * self.args.rest_clients)
+
+    async def rest(self, client: httpx.AsyncClient, name: str, request: Callable[[int], Awaitable]) -> dict:
+        phase = Phase(name)
+
+        async def worker(offset: int):
+            for index in range(self.args.requests):
+                async def call():
+                    (await request(offset + index)).raise_for_status()
+                await phase.timed(call)
+
+        workers = [lambda offset=offset: worker(offset) for offset in range(self.args.rest_clients)]
+        return await self.run_phase(client, phase, workers)
+
+    def login(self, client: httpx.AsyncClient):
+        def request(index: int):
+            email, _ = self.tokens[index % len(self.tokens)]
+            return client.post("/api/user/login", data={"username": email, "password": "bench-password"})
+        return request
+
+    def authorized(self, client: httpx.AsyncClient, path: str):
+        def request(index: int):
+            _, token = self.tokens[index % len(self.tokens)]
+            return client.get(path, headers={"Authorization": f"Bearer {token}"})
+        return request
+
+    async def assistant(self, client: httpx.AsyncClient) -> dict:
+        phase = Phase("assistant")
+        ws_base = self.base.replace("http", "ws", 1)
+
+        async def worker(user: int):
+            _, token = self.tokens[user]
+            url = f"{ws_base}/api/ai/?Authorization={urllib.parse.quote(token)}&stream=1"
+            asked = 0
+            try:
+                async with websockets.connect(url, max_size=None) as socket:
+                    for index in range(self.args.messages):
+                        question = f"Вопрос {index}" if self.args.repeat_questions else f"Вопрос {user}-{index}"
+                        asked += 1
+                        await phase.timed(lambda: self.ask(socket, question, phase))
+            except Exception:
+                # the socket failed: count the questions it never got to ask
+                phase.errors += self.args.messages - asked
+
+        workers = [lambda user=user: worker(user) for user in range(len(self.tokens))]
+        return await self.run_phase(client, phase, workers)
+
+    async def ask(self, socket, question: str, phase: Phase):
+        start = time.perf_counter()
+        await socket.send(question)
+        while True:
+            frame = json.loads(await socket.recv())
+            if frame["type"] == "delta" and frame.get("content"):
+                phase.first_tokens.append((time.perf_counter() - start) * 1000)
+                # later deltas of the same answer are not first tokens
+                while frame["type"] == "delta":
+                    frame = json.loads(await socket.recv())
+            if frame["type"] == "done":
+                return
+            if frame["type"] in ("error", "busy"):
+                raise RuntimeError(frame["type"])
+
+    async def run(self) -> dict:
+        mongo = pymongo.MongoClient(self.args.mongo)
+        mongo.drop_database(mongo.get_default_database("bench").name)
+        mongo.close()
+        self.start()
+        try:
+            async with httpx.AsyncClient(base_url=self.base, timeout=120) as client:
+                await self.wait_ready(client)
+                phases = {"sign_up": await self.sign_up(client)}
+                phases["login"] = await self.rest(client, "login", self.login(client))
+                phases["get_current_user"] = await self.rest(
+                    client, "get_current_user", self.authorized(client, "/api/user/")
+                )
+                phases["assistant"] = await self.assistant(client)
+                phases["history"] = await self.rest(client, "history", self.authorized(client, "/api/ai/"))
+                phases["history_page"] = await self.rest(
+                    client, "history_page", self.authorized(client, "/api/ai/messages?limit=20")
+                )
+        finally:
+            self.stop()
+
+        return {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "config": {key: value for key, value in vars(self.args).items() if key not in ("out", "mongo")},
+            "phases": phases,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="WebSocket users (also the number of accounts)")
+    parser.add_argument("--messages", type=int, default=5, help="questions per WebSocket user")
+    parser.add_argument("--rest-clients", type=int, default=10, help="concurrent REST clients")
+    parser.add_argument("--requests", type=int, default=50, help="requests per REST client and phase")
+    parser.add_argument("--repeat-questions", action="store_true", help="let users ask the same questions")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-chunks", type=int, default=20)
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.02)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--llm-port", type=int, default=8101)
+    parser.add_argument("--mongo", default=os.environ.get("BENCH_MONGO_DSN", "mongodb://localhost:27017/bench"))
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(Bench(args).run()), indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils import admission, cache, resilience, session
+
+
+@pytest.fixture
+def anyio_backend():
+    # async tests run on asyncio through the anyio plugin that ships with anyio
+    return "asyncio"
+
+
+class Clock:
+    """
+    Stand-in for time.monotonic that only moves when told to.
+    """
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # replaces the `time` name of the modules that only read time.monotonic, so the
+    # event loop keeps the real clock and async tests can use it too
+    clock = Clock()
+    for module in (admission, cache, resilience, session):
+        monkeypatch.setattr(module, "time", SimpleNamespace(monotonic=clock))
+    return clock
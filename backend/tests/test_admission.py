@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from app.utils.admission import Admission, MemoryBuckets, Overloaded
+
+pytestmark = pytest.mark.anyio
+
+
+def make_admission(**overrides) -> Admission:
+    settings = dict(
+        buckets=MemoryBuckets(),
+        user_per_minute=60,
+        user_burst=2,
+        role_per_minute=600,
+        role_burst=100,
+        max_concurrent=1,
+        max_waiting=1,
+        wait_timeout=1
+    )
+    settings.update(overrides)
+    return Admission(**settings)
+
+
+async def test_bucket_allows_a_burst_then_refills(clock):
+    buckets = MemoryBuckets()
+    assert await buckets.take("key", capacity=2, rate=1) == 0
+    assert await buckets.take("key", capacity=2, rate=1) == 0
+    assert await buckets.take("key", capacity=2, rate=1) == pytest.approx(1)
+    clock.advance(0.5)
+    assert await buckets.take("key", capacity=2, rate=1) == pytest.approx(0.5)
+    clock.advance(0.5)
+    assert await buckets.take("key", capacity=2, rate=1) == 0
+
+
+async def test_bucket_does_not_grow_beyond_capacity(clock):
+    buckets = MemoryBuckets()
+    await buckets.take("key", capacity=1, rate=1)
+    clock.advance(100)
+    assert await buckets.take("key", capacity=1, rate=1) == 0
+    assert await buckets.take("key", capacity=1, rate=1) > 0
+
+
+async def test_user_over_its_rate_is_refused(clock):
+    admission = make_admission()
+    await admission.check_rate("alice", "student")
+    await admission.check_rate("alice", "student")
+    with pytest.raises(Overloaded) as refused:
+        await admission.check_rate("alice", "student")
+    assert refused.value.reason == "rate_limited"
+    assert refused.value.retry_after == pytest.approx(1)
+    # other users have buckets of their own
+    await admission.check_rate("bob", "student")
+    assert admission.rate_limited == 1
+
+
+async def test_role_over_its_rate_is_refused(clock):
+    admission = make_admission(role_per_minute=60, role_burst=1)
+    await admission.check_rate("alice", "student")
+    with pytest.raises(Overloaded):
+        await admission.check_rate("bob", "student")
+    await admission.check_rate("bob", "teacher")
+
+
+async def test_slot_is_refused_when_the_wait_queue_is_full():
+    admission = make_admission(max_waiting=0)
+    async with admission.slot():
+        with pytest.raises(Overloaded) as refused:
+            async with admission.slot():
+                pass
+    assert refused.value.reason == "busy"
+    assert admission.stats() == {"waiting": 0, "admitted": 1, "rate_limited": 0, "rejected": 1}
+
+
+async def test_slot_wait_is_bounded():
+    admission = make_admission(wait_timeout=0.01)
+    async with admission.slot():
+        with pytest.raises(Overloaded):
+            async with admission.slot():
+                pass
+    assert admission.waiting == 0
+    assert admission.rejected == 1
+
+
+async def test_waiting_call_gets_the_released_slot():
+    admission = make_admission()
+    order = []
+    release = asyncio.Event()
+
+    async def call(name: str, hold: asyncio.Event | None = None):
+        async with admission.slot():
+            order.append(name)
+            if hold is not None:
+                await hold.wait()
+
+    first = asyncio.create_task(call("first", release))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(call("second"))
+    await asyncio.sleep(0)
+    assert admission.waiting == 1
+    release.set()
+    await asyncio.gather(first, second)
+    assert order == ["first", "second"]
+    assert admission.admitted == 2
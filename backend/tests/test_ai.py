@@ -0,0 +1,40 @@
+import pytest
+from gigachat.exceptions import AuthenticationError, ResponseError
+from gigachat.models import Chat, Messages, MessagesRole
+
+from app.routers.ai import LLM_TIMEOUT_REPLY, UNAVAILABLE_REPLY, reply, reply_streaming
+from app.utils.resilience import CircuitOpen, LLMUnavailable
+
+pytestmark = pytest.mark.anyio
+
+PAYLOAD = Chat(messages=[Messages(role=MessagesRole.USER, content="Привет")])
+
+
+class FailingLLM:
+    def __init__(self, error: Exception):
+        self.error = error
+
+    async def chat(self, payload):
+        raise self.error
+
+    async def stream(self, payload):
+        yield "При"
+        raise self.error
+
+
+@pytest.mark.parametrize("error, detail", [
+    (CircuitOpen(30), UNAVAILABLE_REPLY),
+    (LLMUnavailable("deadline"), LLM_TIMEOUT_REPLY),
+    (ResponseError("url", 400, b"", None), UNAVAILABLE_REPLY),
+    (AuthenticationError("url", 401, b"", None), UNAVAILABLE_REPLY),
+])
+@pytest.mark.parametrize("call", [reply, reply_streaming])
+async def test_failed_call_closes_the_reply_with_an_error(call, error, detail):
+    frames = []
+
+    async def emit(frame):
+        frames.append(frame)
+
+    assert await call(FailingLLM(error), emit, PAYLOAD) is None
+    assert frames[0]["type"] == "start"
+    assert frames[-1] == {"type": "error", "id": frames[0]["id"], "detail": detail}
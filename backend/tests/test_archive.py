@@ -0,0 +1,57 @@
+import pytest
+
+from app.utils import archive
+from app.utils.archive import Compactor
+from app.utils.backplane import InMemoryBroker
+
+pytestmark = pytest.mark.anyio
+
+
+class Messages:
+    """Fake of the messages collection that records the aggregations run over it."""
+
+    def __init__(self):
+        self.pipelines = []
+
+    async def _rows(self):
+        for row in ():
+            yield row
+
+    def aggregate(self, pipeline: list):
+        self.pipelines.append(pipeline)
+        return self._rows()
+
+
+@pytest.fixture
+def messages(monkeypatch):
+    messages = Messages()
+    monkeypatch.setattr(archive.ChatMessage, "get_motor_collection", lambda: messages)
+    return messages
+
+
+def make_compactor(broker, **overrides) -> Compactor:
+    options = dict(keep=10, min_age=60, chunk_size=5, interval=30)
+    options.update(overrides)
+    return Compactor(broker, **options)
+
+
+async def test_one_worker_compacts_per_interval(messages):
+    broker = InMemoryBroker()
+    first, second = make_compactor(broker), make_compactor(broker)
+
+    await first.compact_all()
+    await second.compact_all()
+
+    assert len(messages.pipelines) == 1
+    assert first.stats()["runs"] == 1
+    assert second.stats()["skipped"] == 1
+
+
+async def test_scan_is_limited_to_messages_older_than_the_cutoff(messages):
+    compactor = make_compactor(InMemoryBroker())
+
+    await compactor.compact_all()
+
+    first_stage, *_, last_stage = messages.pipelines[0]
+    assert list(first_stage["$match"]["_id"]) == ["$lt"]
+    assert last_stage == {"$match": {"count": {"$gte": 5}}}
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+
+import orjson
+import pytest
+from fastapi import WebSocketDisconnect
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from app.utils import protocol
+from app.utils.backplane import Broker, InMemoryBroker, MongoBroker, SessionHub
+
+pytestmark = pytest.mark.anyio
+
+
+class Socket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text: str):
+        self.sent.append(text)
+
+    async def send_bytes(self, data: bytes):
+        self.sent.append(data)
+
+
+def recorder(messages: list):
+    async def handler(message: dict):
+        messages.append(message)
+    return handler
+
+
+class DeadSocket(Socket):
+    def __init__(self, error: Exception):
+        super().__init__()
+        self.error = error
+
+    async def send_text(self, text: str):
+        raise self.error
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+async def hubs():
+    """
+    Two hubs on one in-memory broker, standing in for two workers.
+    """
+    broker = InMemoryBroker()
+    hubs = SessionHub(broker), SessionHub(broker)
+    for hub in hubs:
+        await hub.start()
+    yield hubs
+    for hub in hubs:
+        await hub.close()
+
+
+async def test_frames_reach_the_users_sockets_on_every_worker(hubs):
+    local, remote = hubs
+    plain, streaming, other_user = Socket(), Socket(), Socket()
+    with local.connect("alice", plain, None), remote.connect("alice", streaming, protocol.STREAM_JSON), \
+            remote.connect("bob", other_user, protocol.STREAM_JSON):
+        await local.publish("alice", protocol.start("m1"))
+        await local.publish("alice", protocol.delta("m1", "При"))
+        await local.publish("alice", protocol.done("m1", "Привет"))
+        await settle()
+    assert plain.sent == ["Привет"]
+    assert [orjson.loads(frame)["type"] for frame in streaming.sent] == ["start", "delta", "done"]
+    assert other_user.sent == []
+
+
+@pytest.mark.parametrize("error", [WebSocketDisconnect(1006), OSError("broken pipe")])
+async def test_dead_socket_is_dropped_and_the_others_still_get_the_frame(hubs, error):
+    local, _ = hubs
+    dead, alive = DeadSocket(error), Socket()
+    with local.connect("alice", dead, None), local.connect("alice", alive, None):
+        await local.publish("alice", protocol.done("m1", "Привет"))
+        assert alive.sent == ["Привет"]
+        assert list(local.sockets["alice"]) == [alive]
+
+
+async def test_invalidate_bumps_sessions_on_other_workers(hubs):
+    local, remote = hubs
+    with remote.connect("alice", Socket(), None):
+        await local.invalidate("alice")
+        await local.invalidate("bob")
+        await settle()
+        assert remote.version("alice") == 1
+        assert remote.version("bob") == 0
+    # the counter goes away with the user's last socket
+    assert remote.versions == {}
+
+
+async def test_broadcast_reaches_other_workers_only(hubs, caplog):
+    local, remote = hubs
+    received = {"local": [], "remote": []}
+
+    async def failing(message):
+        raise RuntimeError("bad prompts")
+
+    local.subscribe("prompts", recorder(received["local"]))
+    remote.subscribe("prompts", failing)
+    with caplog.at_level(logging.ERROR, logger="app.utils.backplane"):
+        await local.broadcast("prompts", {"versions": {"student": "v1"}})
+        await settle()
+    assert received["local"] == []
+    assert "handling a message on prompts: failed" in caplog.text
+
+    # the listener survives a failing handler
+    remote.subscribe("prompts", recorder(received["remote"]))
+    await local.broadcast("prompts", {"versions": {"student": "v2"}})
+    await settle()
+    assert [message["versions"] for message in received["remote"]] == [{"student": "v2"}]
+
+
+async def test_listener_survives_a_failed_delivery(hubs, monkeypatch):
+    local, remote = hubs
+    socket = Socket()
+    deliver = remote.deliver
+
+    async def failing_once(user_id, frame):
+        monkeypatch.setattr(remote, "deliver", deliver)
+        raise RuntimeError("encoder bug")
+
+    monkeypatch.setattr(remote, "deliver", failing_once)
+    with remote.connect("alice", socket, None):
+        await local.publish("alice", protocol.done("m1", "первый"))
+        await settle()
+        await local.publish("alice", protocol.done("m2", "второй"))
+        await settle()
+    assert socket.sent == ["второй"]
+
+
+class FlakyBroker(InMemoryBroker):
+    """
+    The first stream it hands out fails on its first message.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.streams = 0
+
+    def listen(self):
+        self.streams += 1
+        if self.streams == 1:
+            return self._broken()
+        return super().listen()
+
+    async def _broken(self):
+        raise PyMongoError("change stream closed")
+        yield
+
+
+async def test_listener_restarts_a_failed_stream():
+    broker = FlakyBroker()
+    # only `remote` listens, so every stream the broker hands out is its
+    local, remote = SessionHub(broker), SessionHub(broker)
+    remote.restart_delay = 0
+    await remote.start()
+    try:
+        socket = Socket()
+        with remote.connect("alice", socket, None):
+            await settle()
+            await local.publish("alice", protocol.done("m1", "Привет"))
+            await settle()
+        assert broker.streams == 2
+        assert socket.sent == ["Привет"]
+    finally:
+        await remote.close()
+
+
+class Collection:
+    def __init__(self):
+        self.calls = []
+        self.duplicate = False
+
+    async def insert_one(self, document):
+        self.calls.append(("insert_one", document))
+
+    async def update_one(self, query, update, upsert=False):
+        self.calls.append(("update_one", query["_id"]))
+        if self.duplicate:
+            raise DuplicateKeyError("E11000")
+
+    async def delete_one(self, query):
+        self.calls.append(("delete_one", query["_id"]))
+
+
+@pytest.fixture
+def mongo_broker() -> MongoBroker:
+    return MongoBroker({"events": Collection(), "claims": Collection(), "nodes": Collection()})
+
+
+async def test_mongo_broker_without_peers_stays_in_memory(mongo_broker):
+    await mongo_broker.publish("user:alice", {"node": "n", "frame": protocol.done("m1", "Привет")})
+    assert await mongo_broker.claim("alice:question", 60)
+    assert not await mongo_broker.claim("alice:question", 60)
+    await mongo_broker.release("alice:question")
+    assert await mongo_broker.claim("alice:question", 60)
+    assert mongo_broker.events.calls == mongo_broker.claims.calls == []
+
+
+async def test_mongo_broker_with_peers_publishes_and_claims_in_mongo(mongo_broker):
+    mongo_broker.peers = 1
+    await mongo_broker.publish("user:alice", {"node": "n", "frame": protocol.done("m1", "Привет")})
+    assert [call[0] for call in mongo_broker.events.calls] == ["insert_one"]
+
+    assert await mongo_broker.claim("alice:question", 60)
+    await mongo_broker.release("alice:question")
+    assert mongo_broker.claims.calls == [("update_one", "alice:question"), ("delete_one", "alice:question")]
+
+    # claimed on another worker: refused, and the local claim is given back
+    mongo_broker.claims.duplicate = True
+    assert not await mongo_broker.claim("alice:question", 60)
+    mongo_broker.claims.duplicate = False
+    assert await mongo_broker.claim("alice:question", 60)
+
+
+def test_incomplete_broker_fails_when_constructed():
+    class PublishOnly(Broker):
+        async def publish(self, channel, message):
+            pass
+
+    with pytest.raises(TypeError):
+        PublishOnly()
@@ -0,0 +1,62 @@
+from app.utils.cache import TTLCache
+
+
+def test_get_returns_default_for_missing_key():
+    cache = TTLCache(maxsize=2, ttl=10)
+    assert cache.get("a") is None
+    assert cache.get("a", 0) == 0
+    assert cache.stats() == {"size": 0, "hits": 0, "misses": 2}
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    clock.advance(10)
+    assert cache.get("a") == 1
+    clock.advance(0.1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_per_entry_ttl_overrides_default(clock):
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1, ttl=1)
+    clock.advance(2)
+    assert cache.get("a") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_falsy_values_are_hits():
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", False)
+    assert cache.get("a", "missing") is False
+    assert cache.hits == 1
+
+
+def test_items_skip_expired_entries(clock):
+    cache = TTLCache(maxsize=3, ttl=10)
+    cache.set("a", 1, ttl=1)
+    cache.set("b", 2)
+    clock.advance(5)
+    assert cache.items() == [("b", 2)]
+
+
+def test_discard_where_and_pop():
+    cache = TTLCache(maxsize=3, ttl=10)
+    cache.set(("role", "v1"), 1)
+    cache.set(("role", "v2"), 2)
+    cache.set("other", 3)
+    cache.discard_where(lambda key, value: value == 1)
+    cache.pop("other")
+    cache.pop("missing")
+    assert [key for key, _ in cache.items()] == [("role", "v2")]
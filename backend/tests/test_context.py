@@ -0,0 +1,117 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+from beanie import PydanticObjectId
+
+from app.utils import context, history
+from app.utils.history import MessageView
+
+pytestmark = pytest.mark.anyio
+
+
+def conversation(count: int, content: str = "вопрос") -> list:
+    """
+    `count` alternating user and assistant messages, oldest first.
+    """
+    return [
+        MessageView(_id=PydanticObjectId(), role="user" if i % 2 == 0 else "ai", content=f"{content} {i}")
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = SimpleNamespace(messages=[], summary=None, refreshes=[])
+
+    async def get_recent(user_id, limit):
+        return list(reversed(store.messages))[:limit]
+
+    async def get_summary(user_id):
+        return store.summary
+
+    def refresh_summary(user_id, until, summary, llm):
+        store.refreshes.append(until)
+
+    monkeypatch.setattr(history, "get_recent", get_recent)
+    monkeypatch.setattr(context, "get_summary", get_summary)
+    monkeypatch.setattr(context, "refresh_summary", refresh_summary)
+    monkeypatch.setattr(context, "CONTEXT_MAX_MESSAGES", 4)
+    monkeypatch.setattr(context, "CONTEXT_TOKEN_BUDGET", 1000)
+    return store
+
+
+def contents(messages) -> list:
+    return [message.content for message in messages]
+
+
+async def test_short_history_is_sent_whole_without_summary(store):
+    store.messages = conversation(3)
+    notes, messages = await context.assemble("user", llm=None)
+    assert notes == []
+    assert contents(messages) == ["вопрос 0", "вопрос 1", "вопрос 2"]
+    assert store.refreshes == []
+
+
+async def test_messages_older_than_the_window_are_summarised(store):
+    store.messages = conversation(10)
+    notes, messages = await context.assemble("user", llm=None)
+    assert contents(messages) == ["вопрос 6", "вопрос 7", "вопрос 8", "вопрос 9"]
+    # up to the message just before the window, although every turn fits the budget
+    assert store.refreshes == [store.messages[5].id]
+
+
+async def test_gap_between_summary_and_window_is_summarised(store):
+    store.messages = conversation(10)
+    store.summary = SimpleNamespace(content="раньше", covered_until=store.messages[2].id)
+    notes, messages = await context.assemble("user", llm=None)
+    assert notes == ["Краткое содержание предыдущего разговора: раньше"]
+    assert contents(messages) == ["вопрос 6", "вопрос 7", "вопрос 8", "вопрос 9"]
+    assert store.refreshes == [store.messages[5].id]
+
+
+async def test_summary_reaching_the_window_is_not_refreshed(store):
+    store.messages = conversation(10)
+    store.summary = SimpleNamespace(content="раньше", covered_until=store.messages[5].id)
+    _, messages = await context.assemble("user", llm=None)
+    assert contents(messages) == ["вопрос 6", "вопрос 7", "вопрос 8", "вопрос 9"]
+    assert store.refreshes == []
+
+
+async def test_window_stops_at_messages_the_summary_covers(store):
+    store.messages = conversation(10)
+    store.summary = SimpleNamespace(content="раньше", covered_until=store.messages[7].id)
+    _, messages = await context.assemble("user", llm=None)
+    assert contents(messages) == ["вопрос 8", "вопрос 9"]
+    assert store.refreshes == []
+
+
+async def test_budget_cuts_the_window_and_refreshes_up_to_the_cut(store, monkeypatch):
+    store.messages = conversation(3, content="слово " * 100)
+    monkeypatch.setattr(context, "CONTEXT_TOKEN_BUDGET", context.estimate_tokens(store.messages[2].content) + 1)
+    _, messages = await context.assemble("user", llm=None)
+    assert contents(messages) == [store.messages[2].content]
+    assert store.refreshes == [store.messages[1].id]
+
+
+async def test_failed_refresh_is_logged(monkeypatch, caplog):
+    messages = conversation(2)
+
+    async def get_between(user_id, after, until, limit):
+        return messages
+
+    class FailingLLM:
+        async def chat(self, payload):
+            raise RuntimeError("upstream down")
+
+    monkeypatch.setattr(history, "get_between", get_between)
+    with caplog.at_level(logging.ERROR, logger="app.utils.context"):
+        await context._refresh_summary("user", messages[-1].id, None, FailingLLM())
+    assert "summary refresh failed" in caplog.text
+    assert "user" not in context._refreshing
+
+
+def test_estimate_tokens_counts_word_pieces_and_punctuation():
+    assert context.estimate_tokens("") == 0
+    assert context.estimate_tokens("да, нет") == 3
+    assert context.estimate_tokens("расписание") == 3
@@ -0,0 +1,117 @@
+from types import SimpleNamespace
+
+import pytest
+from beanie import PydanticObjectId
+
+from app.utils import history
+from app.utils.history import MessageView
+
+pytestmark = pytest.mark.anyio
+
+
+class Query:
+    def __init__(self, items: list):
+        self.items = items
+
+    def limit(self, count: int) -> "Query":
+        return Query(self.items[:count])
+
+    async def to_list(self) -> list:
+        return self.items
+
+    async def _iterate(self):
+        for item in self.items:
+            yield item
+
+    def __aiter__(self):
+        return self._iterate()
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """
+    Hot messages and archived runs of one user, oldest first, read through fakes of
+    the two queries history builds.
+    """
+    store = SimpleNamespace(messages=[], runs=[])
+
+    def newest_first(user_id, before=None):
+        return Query([
+            message for message in reversed(store.messages) if before is None or message.id < before
+        ])
+
+    def archived_runs(user_id, before=None):
+        return Query([
+            SimpleNamespace(data=history.pack(run)) for run in reversed(store.runs)
+            if before is None or run[0].id < before
+        ])
+
+    monkeypatch.setattr(history, "newest_first", newest_first)
+    monkeypatch.setattr(history, "archived_runs", archived_runs)
+    return store
+
+
+def messages(count: int) -> list:
+    return [MessageView(_id=PydanticObjectId(), role="user", content=str(i)) for i in range(count)]
+
+
+async def pages(limit: int) -> list:
+    result, cursor = [], None
+    while True:
+        page, cursor = await history.get_page("user", limit, PydanticObjectId(cursor) if cursor else None)
+        result.append([item["content"] for item in page])
+        if cursor is None:
+            return result
+
+
+async def test_pages_walk_back_through_history(store):
+    store.messages = messages(5)
+    assert await pages(2) == [["4", "3"], ["2", "1"], ["0"]]
+
+
+async def test_last_full_page_has_no_cursor(store):
+    store.messages = messages(4)
+    assert await pages(2) == [["3", "2"], ["1", "0"]]
+
+
+async def test_cursor_points_at_the_last_message_of_the_page(store):
+    store.messages = messages(3)
+    page, cursor = await history.get_page("user", 2)
+    assert cursor == str(store.messages[1].id)
+    assert page == [{"id": str(store.messages[2].id), "role": "user", "content": "2"},
+                    {"id": str(store.messages[1].id), "role": "user", "content": "1"}]
+
+
+async def test_empty_history(store):
+    assert await history.get_page("user", 10) == ([], None)
+
+
+async def test_pages_continue_into_the_archive(store):
+    older = messages(6)
+    store.runs = [older[:3], older[3:]]
+    store.messages = messages(3)
+    for i, message in enumerate(store.messages):
+        message.content = str(6 + i)
+    assert await pages(4) == [["8", "7", "6", "5"], ["4", "3", "2", "1"], ["0"]]
+
+
+async def test_iter_messages_reads_both_tiers_newest_first(store):
+    older = messages(4)
+    store.runs = [older[:2], older[2:]]
+    store.messages = messages(2)
+    for i, message in enumerate(store.messages):
+        message.content = str(4 + i)
+    assert [item["content"] async for item in history.iter_messages("user")] == ["5", "4", "3", "2", "1", "0"]
+
+
+async def test_iter_messages_before_a_cursor_inside_a_run(store):
+    store.runs = [messages(4)]
+    before = store.runs[0][2].id
+    assert [item["content"] async for item in history.iter_messages("user", before)] == ["1", "0"]
+
+
+def test_pack_round_trip():
+    original = messages(3)
+    original[1].content = "ёлка, \"кавычки\" и\nперевод строки"
+    unpacked = history.unpack(SimpleNamespace(data=history.pack(original)))
+    assert [(m.id, m.role, m.content) for m in unpacked] == [(m.id, m.role, m.content) for m in original]
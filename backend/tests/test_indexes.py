@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import pytest
+from beanie.odm.fields import IndexModelField
+from pymongo import IndexModel
+
+from app.utils.indexes import index_report, reconcile_ttl_indexes
+
+pytestmark = pytest.mark.anyio
+
+
+class Collection:
+    name = "archive"
+
+    def __init__(self, information: dict, usage: dict):
+        self.information = information
+        self.usage = usage
+
+    async def index_information(self) -> dict:
+        return self.information
+
+    async def aggregate(self, pipeline):
+        for name, ops in self.usage.items():
+            yield {"name": name, "accesses": {"ops": ops}}
+
+
+def model(collection: Collection, *indexes: IndexModel):
+    settings = SimpleNamespace(indexes=[IndexModelField(index) for index in indexes])
+    return SimpleNamespace(get_motor_collection=lambda: collection, get_settings=lambda: settings)
+
+
+async def test_existing_indexes_are_not_reported_missing():
+    collection = Collection(
+        {
+            "_id_": {"key": [("_id", 1)], "v": 2},
+            "user_id_1_first_id_1": {"key": [("user_id", 1), ("first_id", 1)], "v": 2, "unique": True},
+        },
+        {"_id_": 0, "user_id_1_first_id_1": 5}
+    )
+    archive = model(
+        collection,
+        IndexModel([("user_id", 1), ("first_id", 1)], unique=True),
+        IndexModel([("user_id", 1), ("last_id", -1)]),
+    )
+    assert await index_report([archive]) == {"archive": {"missing": ["user_id_1_last_id_-1"], "unused": []}}
+
+
+async def test_index_with_another_direction_is_missing_and_unused_ones_are_listed():
+    collection = Collection(
+        {"user_id_1_last_id_1": {"key": [("user_id", 1), ("last_id", 1)], "v": 2}},
+        {"user_id_1_last_id_1": 0}
+    )
+    archive = model(collection, IndexModel([("user_id", 1), ("last_id", -1)]))
+    assert await index_report([archive]) == {
+        "archive": {"missing": ["user_id_1_last_id_-1"], "unused": ["user_id_1_last_id_1"]}
+    }
+
+
+async def test_compound_index_in_another_field_order_is_missing():
+    collection = Collection(
+        {"last_id_-1_user_id_1": {"key": [("last_id", -1), ("user_id", 1)], "v": 2}},
+        {"last_id_-1_user_id_1": 1}
+    )
+    archive = model(collection, IndexModel([("user_id", 1), ("last_id", -1)]))
+    assert await index_report([archive]) == {"archive": {"missing": ["user_id_1_last_id_-1"], "unused": []}}
+
+
+class Database:
+    def __init__(self, information: dict):
+        self.collection = Collection(information, {})
+        self.commands = []
+
+    def __getitem__(self, name: str) -> Collection:
+        return self.collection
+
+    async def command(self, command: dict):
+        self.commands.append(command)
+
+
+class Answers:
+    class Settings:
+        name = "answers"
+        indexes = [
+            IndexModel([("question", 1)], unique=True),
+            IndexModel([("created_at", 1)], expireAfterSeconds=600),
+        ]
+
+
+async def test_changed_ttl_is_applied_with_collmod():
+    database = Database({
+        "question_1": {"key": [("question", 1)], "v": 2, "unique": True},
+        "created_at_1": {"key": [("created_at", 1)], "v": 2, "expireAfterSeconds": 3600},
+    })
+    assert await reconcile_ttl_indexes(database, [Answers]) == ["answers.created_at_1"]
+    assert database.commands == [
+        {"collMod": "answers", "index": {"keyPattern": {"created_at": 1}, "expireAfterSeconds": 600}}
+    ]
+
+
+async def test_unchanged_or_new_ttl_is_left_to_init_beanie():
+    for information in ({}, {"created_at_1": {"key": [("created_at", 1)], "v": 2, "expireAfterSeconds": 600}}):
+        database = Database(information)
+        assert await reconcile_ttl_indexes(database, [Answers]) == []
+        assert database.commands == []
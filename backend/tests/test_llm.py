@@ -0,0 +1,118 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from gigachat.exceptions import ResponseError
+from gigachat.models import Chat, Messages, MessagesRole
+
+from app.utils.llm import LLMPool
+from app.utils.resilience import CircuitBreaker, CircuitOpen, LLMUnavailable
+
+pytestmark = pytest.mark.anyio
+
+PAYLOAD = Chat(messages=[Messages(role=MessagesRole.USER, content="Привет")])
+
+
+def completion(text: str):
+    return SimpleNamespace(text=text, usage=None)
+
+
+def make_pool(**overrides) -> LLMPool:
+    settings = dict(
+        credentials="YmVuY2g6YmVuY2g=",
+        max_concurrency=4,
+        timeout=1,
+        deadline=2,
+        retries=2,
+        retry_backoff=0.001,
+        hedge=True,
+        hedge_min_samples=3,
+        breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    )
+    settings.update(overrides)
+    return LLMPool(**settings)
+
+
+def replies(pool: LLMPool, *outcomes):
+    """
+    Replaces the upstream call: each call takes the next (delay, result or exception).
+    """
+    pending = list(outcomes)
+
+    async def send(payload):
+        async with pool.semaphore:
+            delay, outcome = pending.pop(0)
+            await asyncio.sleep(delay)
+            if isinstance(outcome, BaseException):
+                raise outcome
+            pool.latencies.add(delay)
+            return outcome
+
+    pool._send = send
+    return pending
+
+
+async def test_transient_failures_are_retried():
+    pool = make_pool()
+    replies(pool, (0, ResponseError("url", 503, b"", None)), (0, asyncio.TimeoutError()), (0, completion("ok")))
+    assert (await pool.chat(PAYLOAD)).text == "ok"
+    assert pool.retried == 2
+    assert pool.breaker.failures == 0
+
+
+async def test_other_errors_are_raised_without_retry():
+    pool = make_pool()
+    replies(pool, (0, ResponseError("url", 400, b"", None)), (0, completion("unused")))
+    with pytest.raises(ResponseError):
+        await pool.chat(PAYLOAD)
+    assert pool.retried == 0
+    assert pool.breaker.failures == 0
+
+
+async def test_exhausted_retries_trip_the_breaker():
+    pool = make_pool(retries=0)
+    replies(pool, (0, asyncio.TimeoutError()), (0, asyncio.TimeoutError()), (0, completion("unused")))
+    for _ in range(2):
+        with pytest.raises(LLMUnavailable):
+            await pool.chat(PAYLOAD)
+    assert pool.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpen):
+        await pool.chat(PAYLOAD)
+    assert pool.failures == 2
+
+
+async def test_slow_call_is_hedged_and_the_faster_one_wins():
+    pool = make_pool()
+    for _ in range(3):
+        pool.latencies.add(0.01)
+    replies(pool, (0.5, completion("slow")), (0, completion("hedge")))
+    assert (await pool.chat(PAYLOAD)).text == "hedge"
+    assert (pool.hedged, pool.hedge_wins) == (1, 1)
+
+
+async def test_fast_call_is_not_hedged():
+    pool = make_pool()
+    for _ in range(3):
+        pool.latencies.add(0.05)
+    replies(pool, (0, completion("fast")), (0, completion("unused")))
+    assert (await pool.chat(PAYLOAD)).text == "fast"
+    assert pool.hedged == 0
+
+
+async def test_no_hedging_before_enough_samples():
+    pool = make_pool()
+    pool.latencies.add(0.01)
+    pending = replies(pool, (0.05, completion("only")), (0, completion("unused")))
+    assert (await pool.chat(PAYLOAD)).text == "only"
+    assert pool.hedged == 0
+    assert len(pending) == 1
+
+
+async def test_hedge_does_not_queue_behind_other_calls():
+    pool = make_pool(max_concurrency=1)
+    for _ in range(3):
+        pool.latencies.add(0.01)
+    pending = replies(pool, (0.05, completion("first")), (0, completion("unused")))
+    assert (await pool.chat(PAYLOAD)).text == "first"
+    assert pool.hedged == 0
+    assert len(pending) == 1
@@ -0,0 +1,45 @@
+import threading
+
+from app.utils.metrics import Counter, Histogram, Metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1))
+    histogram.observe(0.05, route="/a")
+    histogram.observe(0.5, route="/a")
+    histogram.observe(5, route="/a")
+    assert histogram.render()[2:] == [
+        'latency_seconds_bucket{route="/a",le="0.1"} 1',
+        'latency_seconds_bucket{route="/a",le="1.0"} 2',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 3',
+        'latency_seconds_sum{route="/a"} 5.55',
+        'latency_seconds_count{route="/a"} 3',
+    ]
+
+
+def test_gauges_add_a_hit_ratio():
+    metrics = Metrics()
+    metrics.gauges("cache", lambda: {"hits": 3, "misses": 1, "state": "closed"})
+    assert metrics.render().splitlines()[-1] == "cache_hit_ratio 0.75"
+
+
+def test_updates_from_other_threads_are_not_lost_while_rendering():
+    counter = Counter("commands_total", "Commands", ("command",))
+    histogram = Histogram("command_seconds", "Command latency", ("command",))
+
+    def driver_thread(thread: int):
+        for i in range(2000):
+            # new label values keep appearing while the loop renders
+            counter.inc(command=f"{thread}-{i % 50}")
+            histogram.observe(0.001, command=f"{thread}-{i % 50}")
+
+    threads = [threading.Thread(target=driver_thread, args=(thread,)) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        counter.render()
+        histogram.render()
+    for thread in threads:
+        thread.join()
+    assert sum(counter.values.values()) == 8000
+    assert sum(sum(counts) for counts, _ in histogram.values.values()) == 8000
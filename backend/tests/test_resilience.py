@@ -0,0 +1,90 @@
+import asyncio
+
+import httpx
+import pytest
+from gigachat.exceptions import ResponseError
+
+from app.utils.resilience import CircuitBreaker, CircuitOpen, LatencyWindow, is_transient
+
+
+def open_breaker(breaker: CircuitBreaker):
+    breaker.acquire()
+    for _ in range(breaker.failure_threshold):
+        breaker.failure()
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.failure()
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.available()
+    with pytest.raises(CircuitOpen) as rejected:
+        breaker.acquire()
+    assert rejected.value.retry_after == 30
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_breaker_lets_one_probe_through_after_the_reset_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    open_breaker(breaker)
+    clock.advance(30)
+    assert breaker.available()
+    breaker.acquire()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.available()
+    with pytest.raises(CircuitOpen):
+        breaker.acquire()
+    breaker.success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.available()
+
+
+def test_failed_probe_opens_the_breaker_again(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    open_breaker(breaker)
+    clock.advance(30)
+    breaker.acquire()
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.retry_after() == 30
+    assert breaker.stats()["opened"] == 2
+
+
+def test_released_probe_frees_the_slot(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    open_breaker(breaker)
+    clock.advance(30)
+    breaker.acquire()
+    breaker.release()
+    breaker.acquire()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+@pytest.mark.parametrize("error, transient", [
+    (asyncio.TimeoutError(), True),
+    (httpx.ConnectError("refused"), True),
+    (ResponseError("url", 429, b"", None), True),
+    (ResponseError("url", 503, b"", None), True),
+    (ResponseError("url", 400, b"", None), False),
+    (ValueError("bad payload"), False),
+])
+def test_is_transient(error, transient):
+    assert is_transient(error) is transient
+
+
+def test_latency_window_quantile():
+    window = LatencyWindow(size=100)
+    assert window.quantile(0.95) is None
+    for value in range(1, 101):
+        window.add(value)
+    assert window.quantile(0.5) == 51
+    assert window.quantile(0.95) == 96
+    window.add(1000)
+    assert len(window.samples) == 100
+    assert window.quantile(1) == 1000
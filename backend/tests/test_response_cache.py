@@ -0,0 +1,126 @@
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from app.utils import response_cache as response_cache_module
+from app.utils.response_cache import ResponseCache, cosine, normalise, trigrams
+
+pytestmark = pytest.mark.anyio
+
+
+class StoredAnswers:
+    """
+    Stand-in for the CachedAnswer collection. Its field attributes only exist so the
+    query expressions evaluate; find_one returns `found`.
+    """
+
+    role = version = audience = question = None
+    found = None
+    inserted = []
+    duplicate = False
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    async def insert(self):
+        if StoredAnswers.duplicate:
+            raise DuplicateKeyError("E11000")
+        StoredAnswers.inserted.append(self)
+
+    @classmethod
+    async def find_one(cls, *conditions):
+        return cls.found
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    monkeypatch.setattr(StoredAnswers, "found", None)
+    monkeypatch.setattr(StoredAnswers, "inserted", [])
+    monkeypatch.setattr(StoredAnswers, "duplicate", False)
+    monkeypatch.setattr(response_cache_module, "CachedAnswer", StoredAnswers)
+    return StoredAnswers
+
+
+@pytest.fixture
+def cache(stored) -> ResponseCache:
+    return ResponseCache(maxsize=100, ttl=60, similarity=0.8, min_length=10, scan_limit=2)
+
+
+def test_normalise():
+    assert normalise("  Где ближайшая  СТАНЦИЯ?! ") == "где ближайшая станция"
+    assert normalise("Ёлка") == "елка"
+
+
+def test_cosine_of_trigrams():
+    assert cosine(trigrams("метро"), trigrams("метро")) == pytest.approx(1)
+    assert cosine(trigrams("метро"), trigrams("шум")) == 0
+
+
+async def test_stored_answer_is_found_by_normalised_question(cache, stored):
+    await cache.store("student", "v1", "до 18/male", "Как купить билет?", "В кассе")
+    assert await cache.lookup("student", "v1", "до 18/male", "как купить  билет") == "В кассе"
+    assert cache.hits == 1
+    assert stored.inserted[0].question == "как купить билет"
+    assert stored.inserted[0].audience == "до 18/male"
+
+
+async def test_answers_are_not_shared_across_role_version_or_audience(cache):
+    await cache.store("student", "v1", "до 18/male", "Как купить билет?", "В кассе")
+    assert await cache.lookup("teacher", "v1", "до 18/male", "Как купить билет?") is None
+    assert await cache.lookup("student", "v2", "до 18/male", "Как купить билет?") is None
+    assert await cache.lookup("student", "v1", "25-34/female", "Как купить билет?") is None
+    assert cache.misses == 3
+
+
+async def test_similar_question_is_answered_from_the_cache(cache):
+    await cache.store("student", "v1", "до 18/male", "как купить билет в метро", "В кассе")
+    assert await cache.lookup("student", "v1", "до 18/male", "как купить билеты в метро") == "В кассе"
+    assert cache.similar_hits == 1
+    assert await cache.lookup("student", "v1", "до 18/male", "где посмотреть расписание") is None
+
+
+async def test_short_questions_are_not_cached(cache, stored):
+    await cache.store("student", "v1", "до 18/male", "Привет", "Привет!")
+    assert stored.inserted == []
+    assert await cache.lookup("student", "v1", "до 18/male", "Привет") is None
+    assert cache.misses == 0
+
+
+async def test_persistent_hit_is_kept_in_memory(cache, stored):
+    stored.found = StoredAnswers(answer="В кассе")
+    assert await cache.lookup("student", "v1", "до 18/male", "Как купить билет?") == "В кассе"
+    stored.found = None
+    assert await cache.lookup("student", "v1", "до 18/male", "Как купить билет?") == "В кассе"
+    assert (cache.persistent_hits, cache.hits) == (1, 1)
+
+
+async def test_concurrent_store_of_the_same_answer_is_ignored(cache, stored):
+    stored.duplicate = True
+    await cache.store("student", "v1", "до 18/male", "Как купить билет?", "В кассе")
+    assert await cache.lookup("student", "v1", "до 18/male", "Как купить билет?") == "В кассе"
+
+
+async def test_discard_stale_drops_old_versions(cache):
+    await cache.store("student", "v1", "до 18/male", "Как купить билет?", "В кассе")
+    await cache.store("teacher", "v1", "до 18/male", "Как купить билет?", "В автомате")
+    cache.discard_stale({"student": "v2", "teacher": "v1"})
+    assert list(cache.candidates) == [("teacher", "v1", "до 18/male")]
+    assert await cache.lookup("student", "v1", "до 18/male", "Как купить билет?") is None
+    assert await cache.lookup("teacher", "v1", "до 18/male", "Как купить билет?") == "В автомате"
+
+
+async def test_similar_lookup_only_scans_the_latest_questions(cache):
+    await cache.store("student", "v1", "до 18/male", "как купить билет в метро", "В кассе")
+    await cache.store("student", "v1", "до 18/male", "где посмотреть расписание", "На сайте")
+    await cache.store("student", "v1", "до 18/male", "когда начинаются занятия", "В сентябре")
+    assert len(cache.candidates[("student", "v1", "до 18/male")]) == 2
+    assert await cache.lookup("student", "v1", "до 18/male", "как купить билеты в метро") is None
+    # out of the scan, but still found by its exact question
+    assert await cache.lookup("student", "v1", "до 18/male", "как купить билет в метро") == "В кассе"
+    assert await cache.lookup("student", "v1", "до 18/male", "где посмотреть расписания") == "На сайте"
+
+
+async def test_expired_candidate_is_forgotten(cache):
+    await cache.store("student", "v1", "до 18/male", "как купить билет в метро", "В кассе")
+    cache.entries.clear()
+    assert await cache.lookup("student", "v1", "до 18/male", "как купить билеты в метро") is None
+    assert cache.candidates[("student", "v1", "до 18/male")] == {}
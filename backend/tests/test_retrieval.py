@@ -0,0 +1,56 @@
+from app.utils.retrieval import KNOWLEDGE_END, KNOWLEDGE_START, MAX_CHUNK_LENGTH, BM25Index, split_long, split_prompt, terms
+
+PROMPT = f"""Ты — виртуальный помощник.
+{KNOWLEDGE_START}
+
+Основные сведения:
+Адрес: Варшавское шоссе, д. 93, станция метро «Варшавская».
+Телефон приёмной: +7 495 000-00-00.
++ Звонки принимаются по будням.
+
+Обучение:
+Расписание занятий публикуется в личном кабинете.
+{KNOWLEDGE_END}
+Отвечай кратко."""
+
+
+def test_terms_are_lowercased_stems():
+    assert terms("Расписания, РАСПИСАНИЕ ёлки") == ["распи", "распи", "елки"]
+
+
+def test_split_prompt_cuts_the_knowledge_into_headed_chunks():
+    instructions, chunks = split_prompt(PROMPT)
+    assert "{knowledge}" in instructions
+    assert "Варшавское" not in instructions
+    assert instructions.endswith(f"{KNOWLEDGE_END}\nОтвечай кратко.")
+    assert chunks == [
+        "Основные сведения: Адрес: Варшавское шоссе, д. 93, станция метро «Варшавская».",
+        "Основные сведения: Телефон приёмной: +7 495 000-00-00. + Звонки принимаются по будням.",
+        "Обучение: Расписание занятий публикуется в личном кабинете.",
+    ]
+
+
+def test_prompt_without_knowledge_is_unchanged():
+    assert split_prompt("Ты — виртуальный помощник.") == ("Ты — виртуальный помощник.", [])
+
+
+def test_long_chunks_are_split_on_sentences():
+    sentence = "Слово " * 30 + "конец."
+    pieces = split_long(" ".join([sentence] * 10))
+    assert len(pieces) > 1
+    assert all(len(piece) <= MAX_CHUNK_LENGTH for piece in pieces)
+    assert all(piece.endswith("конец.") for piece in pieces)
+
+
+def test_search_returns_best_chunks_in_original_order():
+    _, chunks = split_prompt(PROMPT)
+    index = BM25Index(chunks)
+    assert index.search("где посмотреть расписание?", 2) == [chunks[2]]
+    assert index.search("адрес и телефон", 2) == [chunks[0], chunks[1]]
+    assert index.search("адрес и телефон", 1) in ([chunks[0]], [chunks[1]])
+
+
+def test_search_without_matching_terms_is_empty():
+    index = BM25Index(split_prompt(PROMPT)[1])
+    assert index.search("погода", 3) == []
+    assert BM25Index([]).search("адрес", 3) == []
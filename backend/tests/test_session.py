@@ -0,0 +1,23 @@
+from app.utils import session as session_module
+from app.utils.session import AssistantSession
+
+
+def make_session(**overrides) -> AssistantSession:
+    fields = dict(user_id="u", role="student", age=17, gender="male", version=0)
+    fields.update(overrides)
+    return AssistantSession(**fields)
+
+
+def test_session_is_stale_after_an_invalidation(clock):
+    session = make_session()
+    assert not session.stale(0)
+    assert session.stale(1)
+
+
+def test_session_is_stale_after_its_ttl(clock, monkeypatch):
+    monkeypatch.setattr(session_module, "SESSION_TTL", 60)
+    session = make_session(loaded_at=clock())
+    clock.advance(59)
+    assert not session.stale(0)
+    clock.advance(1)
+    assert session.stale(0)
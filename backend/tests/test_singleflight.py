@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from app.utils import protocol
+from app.utils.singleflight import SingleFlight
+
+pytestmark = pytest.mark.anyio
+
+
+class Socket:
+    def __init__(self):
+        self.frames = []
+
+    async def emit(self, frame: dict):
+        self.frames.append(frame)
+
+
+class Call:
+    """
+    An upstream call that streams "При", "вет" and finishes when `finish` is set.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.streamed = asyncio.Event()
+        self.finish = asyncio.Event()
+
+    async def __call__(self, emit) -> str:
+        self.calls += 1
+        await emit(protocol.start("m1"))
+        await emit(protocol.delta("m1", "При"))
+        await emit(protocol.delta("m1", "вет"))
+        self.streamed.set()
+        await self.finish.wait()
+        await emit(protocol.done("m1", "Привет"))
+        return "Привет"
+
+
+async def test_identical_requests_share_one_call():
+    flights, call = SingleFlight(), Call()
+    first, second = Socket(), Socket()
+    runs = [
+        asyncio.create_task(flights.run("key", first.emit, call)),
+        asyncio.create_task(flights.run("key", second.emit, call)),
+    ]
+    await asyncio.sleep(0)
+    call.finish.set()
+    assert await asyncio.gather(*runs) == [("Привет", True), ("Привет", False)]
+    assert call.calls == 1
+    assert first.frames[-1] == second.frames[-1] == protocol.done("m1", "Привет")
+    assert flights.stats() == {"in_flight": 0, "calls": 1, "coalesced": 1}
+
+
+async def test_late_joiner_gets_the_text_so_far_merged():
+    flights, call = SingleFlight(), Call()
+    first, late = Socket(), Socket()
+    leader = asyncio.create_task(flights.run("key", first.emit, call))
+    await call.streamed.wait()
+    follower = asyncio.create_task(flights.run("key", late.emit, call))
+    await asyncio.sleep(0)
+    call.finish.set()
+    await asyncio.gather(leader, follower)
+    assert first.frames == [
+        protocol.start("m1"), protocol.delta("m1", "При"), protocol.delta("m1", "вет"), protocol.done("m1", "Привет")
+    ]
+    assert late.frames == [protocol.start("m1"), protocol.delta("m1", "Привет"), protocol.done("m1", "Привет")]
+
+
+async def test_different_keys_are_separate_calls():
+    flights, call = SingleFlight(), Call()
+    call.finish.set()
+    await asyncio.gather(flights.run("a", Socket().emit, call), flights.run("b", Socket().emit, call))
+    assert call.calls == 2
+
+
+async def test_call_completes_for_followers_when_the_leader_goes_away():
+    flights, call = SingleFlight(), Call()
+    first, second = Socket(), Socket()
+    leader = asyncio.create_task(flights.run("key", first.emit, call))
+    await call.streamed.wait()
+    follower = asyncio.create_task(flights.run("key", second.emit, call))
+    await asyncio.sleep(0)
+    leader.cancel()
+    call.finish.set()
+    assert await follower == ("Привет", False)
+    assert second.frames[-1] == protocol.done("m1", "Привет")
+    # the socket that left is not written to any more
+    assert protocol.done("m1", "Привет") not in first.frames
+
+
+async def test_finished_flight_is_not_joined():
+    flights, call = SingleFlight(), Call()
+    call.finish.set()
+    await flights.run("key", Socket().emit, call)
+    assert await flights.run("key", Socket().emit, call) == ("Привет", True)
+    assert call.calls == 2
+
+
+async def test_failing_subscriber_does_not_fail_the_call_for_the_others():
+    flights, call = SingleFlight(), Call()
+    leader, follower = Socket(), Socket()
+
+    async def dead(frame):
+        raise ConnectionError("socket closed")
+
+    runs = [
+        asyncio.create_task(flights.run("key", leader.emit, call)),
+        asyncio.create_task(flights.run("key", dead, call)),
+        asyncio.create_task(flights.run("key", follower.emit, call)),
+    ]
+    await call.streamed.wait()
+    call.finish.set()
+    assert await asyncio.gather(*runs) == [("Привет", True), ("Привет", False), ("Привет", False)]
+    assert leader.frames[-1] == follower.frames[-1] == protocol.done("m1", "Привет")
@@ -0,0 +1,113 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from app.utils import write_behind
+from app.utils.write_behind import DUPLICATE_KEY, WriteBehind
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def inserts(monkeypatch):
+    """
+    Batches passed to ChatMessage.insert_many; a queued exception fails the next call.
+    """
+    inserts = SimpleNamespace(batches=[], errors=[])
+
+    async def insert_many(batch, ordered=True):
+        if inserts.errors:
+            raise inserts.errors.pop(0)
+        inserts.batches.append([message.content for message in batch])
+
+    monkeypatch.setattr(write_behind.ChatMessage, "insert_many", insert_many)
+    return inserts
+
+
+def messages(user_id: str, *contents) -> list:
+    return [SimpleNamespace(user_id=user_id, content=content) for content in contents]
+
+
+async def test_flush_writes_in_batches_in_order(inserts):
+    writer = WriteBehind(max_buffer=10, batch_size=2, interval=1)
+    await writer.enqueue(messages("a", "1", "2", "3"))
+    await writer.enqueue(messages("b", "4", "5"))
+    assert writer.has_pending("a") and writer.has_pending("b")
+    await writer.flush()
+    assert inserts.batches == [["1", "2"], ["3", "4"], ["5"]]
+    assert not writer.has_pending("a") and not writer.has_pending("b")
+    assert writer.stats() == {"buffered": 0, "flushes": 3, "written": 5, "failures": 0}
+
+
+async def test_flush_user_skips_users_without_pending_messages(inserts):
+    writer = WriteBehind(max_buffer=10, batch_size=10, interval=1)
+    await writer.enqueue(messages("a", "1"))
+    await writer.flush_user("b")
+    assert inserts.batches == []
+    await writer.flush_user("a")
+    assert inserts.batches == [["1"]]
+
+
+async def test_failed_batch_stays_buffered_in_order(inserts):
+    writer = WriteBehind(max_buffer=10, batch_size=2, interval=1)
+    await writer.enqueue(messages("a", "1", "2", "3"))
+    inserts.errors.append(AutoReconnect("primary stepped down"))
+    await writer.flush()
+    assert inserts.batches == []
+    assert [message.content for message in writer.buffer] == ["1", "2", "3"]
+    assert writer.has_pending("a")
+    assert writer.failures == 1
+    await writer.flush()
+    assert inserts.batches == [["1", "2"], ["3"]]
+    assert not writer.has_pending("a")
+
+
+async def test_duplicates_of_a_partial_write_count_as_written(inserts):
+    writer = WriteBehind(max_buffer=10, batch_size=3, interval=1)
+    await writer.enqueue(messages("a", "1", "2", "3"))
+    inserts.errors.append(BulkWriteError({"writeErrors": [
+        {"index": 0, "code": DUPLICATE_KEY},
+        {"index": 2, "code": 91},
+    ]}))
+    await writer.flush()
+    assert [message.content for message in writer.buffer] == ["3"]
+    assert writer.written == 2
+    await writer.flush()
+    assert inserts.batches == [["3"]]
+
+
+async def test_enqueue_waits_for_room(inserts):
+    writer = WriteBehind(max_buffer=2, batch_size=10, interval=10)
+    await writer.start()
+    try:
+        await writer.enqueue(messages("a", "1", "2"))
+        await asyncio.wait_for(writer.enqueue(messages("a", "3")), 1)
+        assert inserts.batches == [["1", "2"]]
+        assert [message.content for message in writer.buffer] == ["3"]
+    finally:
+        await writer.close()
+    assert inserts.batches == [["1", "2"], ["3"]]
+
+
+async def test_close_during_a_write_loses_nothing(monkeypatch):
+    written, started, release = [], asyncio.Event(), asyncio.Event()
+
+    async def slow_insert_many(batch, ordered=True):
+        started.set()
+        await release.wait()
+        written.extend(message.content for message in batch)
+
+    monkeypatch.setattr(write_behind.ChatMessage, "insert_many", slow_insert_many)
+    writer = WriteBehind(max_buffer=10, batch_size=2, interval=10)
+    await writer.start()
+    await writer.enqueue(messages("a", "1", "2"))
+    await started.wait()
+    await writer.enqueue(messages("a", "3"))
+    closing = asyncio.create_task(writer.close())
+    await asyncio.sleep(0)
+    release.set()
+    await closing
+    assert written == ["1", "2", "3"]
+    assert not writer.has_pending("a")
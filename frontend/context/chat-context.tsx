@@ -209,8 +209,17 @@ export function ChatProvider({ children }: { children: React.ReactNode }) {
 
   // Подписка на события WebSocket
   useEffect(() => {
+    // Streamed replies arrive several times under the same id: replace instead of appending
     const handleMessage = (message: Message) => {
-      addMessage(message)
+      setChatState(prev => {
+        if (!prev.messages.some(msg => msg.id === message.id)) {
+          return { ...prev, messages: [...prev.messages, message], error: null, hasHistory: true }
+        }
+        return {
+          ...prev,
+          messages: prev.messages.map(msg => (msg.id === message.id ? message : msg)),
+        }
+      })
     }
 
     const handleConnectionChange = (connected: boolean) => {
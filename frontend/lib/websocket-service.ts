@@ -6,6 +6,7 @@ class WebSocketService {
   private messageHandlers: ((message: Message) => void)[] = [];
   private connectionHandlers: ((connected: boolean) => void)[] = [];
   private errorHandlers: ((error: string) => void)[] = [];
+  private streamingContent = new Map<string, string>();
 
   async connect(token: string): Promise<void> {
     // Quick retry strategy: increase timeout and retry a few times to avoid false timeouts
@@ -36,7 +37,7 @@ class WebSocketService {
     }
 
     const wsUrl = baseUrl.replace(/^https?:\/\//, 'wss://') + '/ai/'
-    const url = `${wsUrl}?Authorization=${encodeURIComponent(token)}`
+    const url = `${wsUrl}?Authorization=${encodeURIComponent(token)}&stream=1`
 
     console.log('🔌 Connecting to WebSocket...')
 
@@ -74,14 +75,7 @@ class WebSocketService {
           }
 
           ws.onmessage = (event) => {
-            const assistantMessage: Message = {
-              id: `ai_${Date.now()}`,
-              content: event.data,
-              sender: 'assistant',
-              timestamp: new Date(),
-              status: 'sent',
-            }
-            this.notifyMessageHandlers(assistantMessage)
+            this.handleFrame(event.data)
           }
 
           ws.onerror = (event) => {
@@ -138,6 +132,51 @@ class WebSocketService {
     }
   }
 
+  // Stream frames: start -> delta* -> done | error, all sharing one message id
+  private handleFrame(data: string): void {
+    let frame: { type: string; id: string; content?: string; detail?: string }
+    try {
+      frame = JSON.parse(data)
+    } catch (_e) {
+      frame = { type: 'done', id: `${Date.now()}`, content: data }
+    }
+
+    const id = `ai_${frame.id}`
+    switch (frame.type) {
+      case 'start':
+        this.streamingContent.set(id, '')
+        this.notifyMessageHandlers(this.assistantMessage(id, '', 'sending'))
+        break
+      case 'delta': {
+        const content = (this.streamingContent.get(id) ?? '') + (frame.content ?? '')
+        this.streamingContent.set(id, content)
+        this.notifyMessageHandlers(this.assistantMessage(id, content, 'sending'))
+        break
+      }
+      case 'done':
+        this.streamingContent.delete(id)
+        this.notifyMessageHandlers(this.assistantMessage(id, frame.content ?? '', 'sent'))
+        break
+      case 'error':
+        this.streamingContent.delete(id)
+        this.notifyMessageHandlers(this.assistantMessage(id, frame.detail ?? '', 'error'))
+        break
+      case 'busy':
+        this.notifyMessageHandlers(this.assistantMessage(`busy_${Date.now()}`, frame.detail ?? '', 'error'))
+        break
+    }
+  }
+
+  private assistantMessage(id: string, content: string, status: Message['status']): Message {
+    return {
+      id,
+      content,
+      sender: 'assistant',
+      timestamp: new Date(),
+      status,
+    }
+  }
+
   private waitForSocketClose(timeoutMs: number): Promise<void> {
     return new Promise((resolve, reject) => {
       if (!this.socket) {